@@ -0,0 +1 @@
+# Benchmarks against a simulated device and stand-in backends, run with python -m bench
@@ -0,0 +1,110 @@
+# Runs the benchmarks and compares them to the stored baselines:
+#
+#     python -m bench                      all benchmarks, exit code 1 on a regression
+#     python -m bench --only leds redraw   some of them
+#     python -m bench --update             store the results as the new baselines
+#
+# Run it from the project folder, like init.py.
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+
+from bench.cases import BENCHMARKS, HIGHER
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# relative change a metric may get worse by before it counts as a regression
+DEFAULT_TOLERANCE = 0.3
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='pyControlCast benchmarks')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    parser.add_argument('--update', action='store_true', help='store the results as the new baselines')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline file to compare to or update')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative regression, 0.3 is 30%% (default)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the iterations of every benchmark')
+    parser.add_argument('--json', metavar='FILE', help='write the results as JSON to FILE')
+    return parser.parse_args()
+
+
+def load_baselines(path):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {'metrics': {}}
+
+
+def change(metric, baseline):
+    """
+    Returns the relative change against <baseline>, positive is an improvement
+    """
+    if not baseline['value']:
+        return 0.0
+    relative = (metric['value'] - baseline['value']) / baseline['value']
+    return relative if metric['better'] == HIGHER else -relative
+
+
+def compare(results, baselines, tolerance):
+    """
+    Prints every metric next to its baseline, returns the names of the regressed metrics
+    """
+    regressions = []
+    print(f'{"metric":52} {"value":>12} {"baseline":>12} {"change":>8}')
+    for name, metric in results.items():
+        baseline = baselines['metrics'].get(name)
+        if baseline is None:
+            print(f'{name:52} {metric["value"]:>12} {"-":>12} {"new":>8}  {metric["unit"]}')
+            continue
+        relative = change(metric, baseline)
+        status = ''
+        if relative < -max(tolerance, metric.get('tolerance', 0)):
+            regressions.append(name)
+            status = 'REGRESSION'
+        print(f'{name:52} {metric["value"]:>12} {baseline["value"]:>12} {relative:>+8.0%}  {metric["unit"]} {status}')
+    return regressions
+
+
+def main():
+    arguments = parse_arguments()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = {}
+    for name in arguments.only or BENCHMARKS:
+        print(f'Running {name}', file=sys.stderr)
+        for metric in BENCHMARKS[name](arguments.scale):
+            results[metric.name] = metric.to_dict()
+
+    if arguments.json:
+        with open(arguments.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    baselines = load_baselines(arguments.baseline)
+    regressions = compare(results, baselines, arguments.tolerance)
+
+    if arguments.update:
+        baselines['metrics'].update(results)
+        baselines['machine'] = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+        }
+        with open(arguments.baseline, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f'Updated {arguments.baseline}')
+        return 0
+
+    if regressions:
+        print(f'{len(regressions)} regressions: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# Stand-in action backends and the engine the benchmarks drive.
+#
+# BenchEngine is the real lp.init.Launchpad on a simulated device. Only the
+# outermost calls of the action backends are replaced: the keyboard never
+# presses keys and the mixer never opens an audio device, both keep the time
+# they were called instead. Sounds are still decoded by lp.sound and OBS
+# requests still go through lp.obs_websocket, to the local OBS stub.
+#
+import os
+import threading
+import time
+import wave
+
+from config import compile_config
+from lp import init as engine
+from lp.launchpad import Midi
+from lp.startup import import_backend
+from lp.virtual import VirtualDevice
+
+FRAME_RATE = 44100
+
+
+class Recorder(object):
+    """
+    Keeps the perf_counter() time of every call and lets the benchmark wait for them
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.condition = threading.Condition()
+
+    def record(self, *args):
+        with self.condition:
+            self.calls.append((time.perf_counter(), args))
+            self.condition.notify_all()
+
+    def wait_for(self, count, timeout=5.0):
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.calls) >= count, timeout):
+                raise TimeoutError(f'{len(self.calls)} of {count} calls after {timeout} seconds')
+            return [at for at, _ in self.calls]
+
+    def clear(self):
+        with self.condition:
+            self.calls = []
+
+
+class StandInKeyboard(Recorder):
+    """
+    Takes the place of pyautogui
+    """
+
+    def hotkey(self, *keys, interval=0.0):
+        self.record(*keys)
+
+
+class StandInMixer(Recorder):
+    """
+    Takes the place of lp.audio.Mixer, play() returns the length of the sound like the real one
+    """
+
+    def play(self, segment, volume=0.0, delay=0.0):
+        self.record(len(segment.raw_data))
+        return len(segment.raw_data) / (segment.frame_rate * segment.channels * segment.sample_width)
+
+    def stop(self):
+        pass
+
+
+class BenchEngine(engine.Launchpad):
+    """
+    The engine with stand-in backends. Times of actions reaching their backend are kept
+    in the recorders, <dispatched> keeps the times of dispatched keyboard actions.
+    """
+
+    def __init__(self, config, midi=None):
+        self.dispatched = Recorder()
+        super(BenchEngine, self).__init__(config, midi)
+
+    def load_keyboard(self):
+        self.keyboard = StandInKeyboard()
+
+    def load_sound(self):
+        sound = import_backend('lp.sound')
+        self.sound_cache = sound.SoundCache()
+        self.sound_prewarm = sound.SoundPrewarm(self.sound_cache)
+        self.mixer = StandInMixer()
+
+    def keyboard_press(self, keys):
+        self.dispatched.record(*keys)
+        super(BenchEngine, self).keyboard_press(keys)
+
+
+def write_sound(path, seconds=0.5, channels=2):
+    """
+    Writes a 16 bit WAV file of silence, WAV is decoded without ffmpeg
+    """
+    with wave.open(path, 'wb') as sound_file:
+        sound_file.setnchannels(channels)
+        sound_file.setsampwidth(2)
+        sound_file.setframerate(FRAME_RATE)
+        sound_file.writeframes(b'\0' * int(seconds * FRAME_RATE) * channels * 2)
+    return path
+
+
+def bench_config(sounds=(), obs_port=None, press_feedback=True):
+    """
+    Returns a compiled config: keyboard actions on the first row, one sound per entry
+    of <sounds> on the second and an OBS scene switch at 0.2 when <obs_port> is given
+    """
+    buttons = {}
+    for x in range(8):
+        buttons[f'{x}.0'] = {'color': {'red': 3, 'green': 0}, 'action': [{'keyboard': {'keys': ['ctrl', 'f1']}}]}
+    for x, path in enumerate(sounds):
+        buttons[f'{x}.1'] = {'color': {'red': 0, 'green': 3}, 'action': [{'sound': {'path': path}}]}
+
+    data = {
+        'active_profile': 'bench',
+        'animation': {'press_feedback': press_feedback},
+        'sound': {'prewarm': False},
+        'profiles': {
+            'bench': {'order': 0, 'buttons': buttons},
+            'other': {'order': 1, 'buttons': {}},
+        },
+    }
+    if obs_port is not None:
+        buttons['0.2'] = {'color': {'red': 3, 'green': 3}, 'action': [{'obs': {'request': 'switch_scene',
+                                                                              'scene': 'Break'}}]}
+        data['obs'] = {'url': '127.0.0.1', 'port': obs_port, 'heartbeat': 60}
+    return compile_config(data)
+
+
+def start_engine(config, model='launchpad'):
+    """
+    Returns the simulated device and the started engine on it
+    """
+    device = VirtualDevice(model)
+    lp = BenchEngine(config, Midi(device.backend))
+    lp.start()
+    return device, lp
+
+
+def sound_files(folder, count=1):
+    return [write_sound(os.path.join(folder, f'bench-{index}.wav')) for index in range(count)]
@@ -0,0 +1,267 @@
+# The benchmarks. Each one returns a list of Metric; names are the keys of the baselines.
+import tempfile
+import time
+
+from bench.backends import bench_config, sound_files, start_engine
+from bench.obs_stub import OBSStub
+from lp import launchpad
+from lp.decoder import get_decoder, KeyEvent
+from lp.virtual import VirtualDevice
+
+LOWER = 'lower'
+HIGHER = 'higher'
+
+# tail latencies swing with the scheduler, they only count as a regression when they are that much worse
+TAIL_TOLERANCE = 1.0
+
+
+class Metric(object):
+    """
+    A single result, <better> tells whether LOWER or HIGHER values are an improvement.
+    <tolerance> overrides the allowed relative regression for noisy metrics.
+    """
+
+    def __init__(self, name, value, unit, better=LOWER, tolerance=None):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.better = better
+        self.tolerance = tolerance
+
+    def to_dict(self):
+        data = {'value': self.value, 'unit': self.unit, 'better': self.better}
+        if self.tolerance is not None:
+            data['tolerance'] = self.tolerance
+        return data
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def latencies(name, values, percents=(50, 90, 99)):
+    """
+    Returns percentile metrics of <values> in seconds as microseconds
+    """
+    return [Metric(f'{name}.p{percent}', round(percentile(values, percent) * 1e6, 1), 'us',
+                   tolerance=TAIL_TOLERANCE if percent >= 90 else None)
+            for percent in percents]
+
+
+def rate(name, count, seconds, unit):
+    return Metric(name, round(count / seconds), unit, HIGHER)
+
+
+def grid_messages(decoder):
+    """
+    Returns a press and a release message for every button of the classic grid
+    """
+    device = VirtualDevice('launchpad')
+    messages = []
+    for y in range(8):
+        for x in range(8):
+            index = decoder.index_of(x, y)
+            messages.append(device.message(index, 127))
+            messages.append(device.message(index, 0))
+    return messages
+
+
+def bench_decode(scale=1.0):
+    decoder = get_decoder('launchpad')
+    messages = grid_messages(decoder) * int(1000 * scale)
+    event = KeyEvent()
+
+    started = time.perf_counter()
+    for message in messages:
+        decoder.decode(message, 0.0, event)
+    single = time.perf_counter() - started
+
+    indices, values = decoder.allocate_batch(len(messages))
+    started = time.perf_counter()
+    decoder.decode_batch(messages, indices, values)
+    batch = time.perf_counter() - started
+
+    return [
+        rate('decode.messages_per_s', len(messages), single, 'msg/s'),
+        rate('decode.batch_messages_per_s', len(messages), batch, 'msg/s'),
+    ]
+
+
+def bench_dispatch(scale=1.0):
+    """
+    Press to dispatch (engine calls the action) and press to backend call (executor ran it)
+    """
+    device, lp = start_engine(bench_config())
+    try:
+        dispatched, called = [], []
+        for count in range(1, int(500 * scale) + 1):
+            x = count % 8
+            started = time.perf_counter()
+            device.press(x, 0)
+            called.append(lp.keyboard.wait_for(count)[-1] - started)
+            dispatched.append(lp.dispatched.calls[-1][0] - started)
+            device.release(x, 0)
+    finally:
+        lp.stop()
+    return latencies('dispatch.press_to_dispatch', dispatched) + latencies('dispatch.press_to_backend', called)
+
+
+def led_writers():
+    """
+    Returns (name, model, write(lp, count)) of every class with single LED writes
+    """
+    return (
+        ('launchpad', 'launchpad', lambda lp, count: lp.led_ctrl_xy(count % 8, (count >> 3) % 8, count % 4, 3)),
+        ('launchpad_pro', 'launchpad_pro', lambda lp, count: lp.led_ctrl_xy_by_code(
+            count % 8, (count >> 3) % 8, count % 128)),
+        ('launchpad_mk2', 'launchpad_mk2', lambda lp, count: lp.led_ctrl_xy_by_code(
+            count % 8, (count >> 3) % 8, count % 128)),
+        ('launch_control_xl', 'launch_control_xl', lambda lp, count: lp.led_ctrl_xy(
+            count % 8, count % 3, count % 4, 3)),
+    )
+
+
+def bench_leds(scale=1.0):
+    """
+    LED writes per second through the public single LED calls, until the device received them
+    """
+    metrics = []
+    count = int(20000 * scale)
+    for name, model, write in led_writers():
+        lp = VirtualDevice(model).open()
+        lp.midi.drain()
+
+        started = time.perf_counter()
+        for index in range(count):
+            write(lp, index)
+        lp.midi.drain(10)
+        elapsed = time.perf_counter() - started
+
+        metrics.append(rate(f'leds.{name}.writes_per_s', count, elapsed, 'writes/s'))
+        lp.close()
+    return metrics
+
+
+def timed_redraws(lp, redraw, count):
+    """
+    Returns the average seconds and messages of <count> calls of redraw(lp, index), including the wire
+    """
+    lp.midi.drain()
+    messages = 0
+    started = time.perf_counter()
+    for index in range(count):
+        messages += redraw(lp, index)
+    lp.midi.drain(10)
+    return (time.perf_counter() - started) / count, messages / count
+
+
+def classic_redraw(swap):
+    def redraw(lp, index):
+        for cell in range(lp.FRAME_SIZE):
+            lp.frame[cell] = lp.led_get_color((cell + index) % 4, (cell + index + 1) % 4)
+        return lp.flush(swap=swap)
+    return redraw
+
+
+def rgb_redraw(lp, index):
+    return lp.led_ctrl_frame({number: ((number + index) % 64, index % 64, 63 - number % 64) for number in lp.LEDS})
+
+
+def code_redraw(lp, index):
+    return lp.led_ctrl_frame({number: (number + index) % 128 for number in lp.LEDS})
+
+
+def bench_redraw(scale=1.0):
+    """
+    Cost of redrawing every LED with a different color
+    """
+    count = int(200 * scale)
+    redraws = (
+        ('launchpad.cells', 'launchpad', {}, classic_redraw(False)),
+        ('launchpad.swap', 'launchpad', {}, classic_redraw(True)),
+        ('launchpad_pro.codes', 'launchpad_pro', {}, code_redraw),
+        ('launchpad_pro.rgb', 'launchpad_pro', {'color_mode': launchpad.LaunchpadPro.COLOR_EXACT}, rgb_redraw),
+        ('launchpad_mk2.rgb', 'launchpad_mk2', {'color_mode': launchpad.LaunchpadPro.COLOR_EXACT}, rgb_redraw),
+    )
+
+    metrics = []
+    for name, model, options, redraw in redraws:
+        lp = VirtualDevice(model).open(**options)
+        seconds, messages = timed_redraws(lp, redraw, count)
+        metrics.append(Metric(f'redraw.{name}.ms', round(seconds * 1000, 3), 'ms'))
+        metrics.append(Metric(f'redraw.{name}.messages', messages, 'messages'))
+        lp.close()
+    return metrics
+
+
+def bench_sound(scale=1.0):
+    """
+    Press to mixer, with the sound decoded on the press (cold) and taken from the cache
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        path, = sound_files(folder)
+        device, lp = start_engine(bench_config([path]))
+        try:
+            times = {'cold': [], 'cached': []}
+            played = 0
+            for kind, count in (('cold', int(100 * scale)), ('cached', int(500 * scale))):
+                for _ in range(count):
+                    if kind == 'cold':
+                        lp.sound_cache.clear()
+                    started = time.perf_counter()
+                    device.press(0, 1)
+                    played += 1
+                    times[kind].append(lp.mixer.wait_for(played)[-1] - started)
+                    device.release(0, 1)
+        finally:
+            lp.stop()
+    return latencies('sound.cold', times['cold']) + latencies('sound.cached', times['cached'])
+
+
+def wait_connected(lp, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not lp.obs.connected:
+        if time.perf_counter() > deadline:
+            raise TimeoutError('Not connected to the OBS stub')
+        time.sleep(0.01)
+
+
+def bench_obs(scale=1.0):
+    """
+    Request round trips to the local OBS stub and press to request arrival
+    """
+    stub = OBSStub().start()
+    device, lp = start_engine(bench_config(obs_port=stub.port))
+    try:
+        wait_connected(lp)
+
+        round_trips = []
+        for _ in range(int(300 * scale)):
+            started = time.perf_counter()
+            lp.obs.submit(lp.obs.client.call('GetVersion')).result(5)
+            round_trips.append(time.perf_counter() - started)
+
+        stub.clear()
+        pressed = []
+        for count in range(1, int(300 * scale) + 1):
+            started = time.perf_counter()
+            device.press(0, 2)
+            pressed.append(stub.wait_for('SetCurrentScene', count)[-1] - started)
+            device.release(0, 2)
+        # responses come in order, this one arrives after the last scene switch finished
+        lp.obs.submit(lp.obs.client.call('GetVersion')).result(5)
+    finally:
+        lp.stop()
+        stub.stop()
+    return latencies('obs.round_trip', round_trips) + latencies('obs.press_to_request', pressed)
+
+
+BENCHMARKS = {
+    'decode': bench_decode,
+    'dispatch': bench_dispatch,
+    'leds': bench_leds,
+    'redraw': bench_redraw,
+    'sound': bench_sound,
+    'obs': bench_obs,
+}
@@ -0,0 +1,96 @@
+# Local obs-websocket (protocol 4.x) server for the benchmarks.
+#
+# Answers the requests lp.obs_websocket sends with canned data and keeps the
+# time every request arrived, so a benchmark can measure press to request.
+#
+import asyncio
+import json
+import threading
+import time
+
+from websockets.asyncio.server import serve
+
+SCENES = [
+    {'name': 'Main', 'sources': [{'name': 'Camera', 'render': True}]},
+    {'name': 'Break', 'sources': []},
+]
+
+
+class OBSStub(object):
+    """
+    Runs the server on its own event loop thread, on a free port unless <port> is given
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+
+        self.scene = SCENES[0]['name']
+        self.received = []
+        self.condition = threading.Condition()
+
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        started = threading.Event()
+
+        async def main():
+            self.server = await serve(self.handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+            await self.server.serve_forever()
+
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(main(),),
+                                       name='obs-stub', daemon=True)
+        self.thread.start()
+        if not started.wait(5):
+            raise RuntimeError('OBS stub did not start')
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    def wait_for(self, request, count, timeout=5.0):
+        """
+        Waits until <count> requests of type <request> arrived, returns their arrival times
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.times(request)) >= count, timeout):
+                raise TimeoutError(f'{len(self.times(request))} of {count} {request} requests after {timeout} seconds')
+            return self.times(request)
+
+    def times(self, request):
+        return [at for at, name in self.received if name == request]
+
+    def clear(self):
+        with self.condition:
+            self.received = []
+
+    async def handle(self, websocket):
+        async for message in websocket:
+            data = json.loads(message)
+            request = data['request-type']
+            with self.condition:
+                self.received.append((time.perf_counter(), request))
+                self.condition.notify_all()
+
+            response = {'message-id': data['message-id'], 'status': 'ok'}
+            if request == 'GetAuthRequired':
+                response['authRequired'] = False
+            elif request == 'GetVersion':
+                response['obs-websocket-version'] = '4.9.1'
+            elif request == 'GetSceneList':
+                response.update({'current-scene': self.scene, 'scenes': SCENES})
+            elif request == 'GetCurrentScene':
+                response.update(name=self.scene, sources=SCENES[0]['sources'])
+            elif request == 'GetSceneItemProperties':
+                response.update(name=data.get('item'), visible=True, position={'x': 0, 'y': 0},
+                                scale={'x': 1.0, 'y': 1.0}, rotation=0)
+            elif request == 'SetCurrentScene':
+                self.scene = data['scene-name']
+                await websocket.send(json.dumps({'update-type': 'SwitchScenes', 'scene-name': self.scene,
+                                                 'sources': []}))
+            await websocket.send(json.dumps(response))
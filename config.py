@@ -0,0 +1,258 @@
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+import yaml
+
+from settings import CACHE_FOLDER
+
+log = logging.getLogger('config')
+
+CONFIG_FILE = os.path.join('conf', 'config.yaml')
+WATCH_INTERVAL = 1.0
+
+# bump when the compiled classes change, older cache files are ignored then
+CACHE_VERSION = b'1'
+
+# libyaml is several times faster, PyYAML may be installed without it
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def to_plain(value):
+    if isinstance(value, (Section, Record)):
+        return value.to_dict()
+    if isinstance(value, tuple):
+        return [to_plain(item) for item in value]
+    return value
+
+
+class ReadOnly(object):
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read only')
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.items() == other.items()
+
+    def to_dict(self):
+        return {key: to_plain(value) for key, value in self.items()}
+
+    # DotMap compatible name
+    toDict = to_dict
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()})'
+
+
+class Section(ReadOnly):
+    """
+    Read only config mapping, values are reachable as items and as attributes
+    """
+    __slots__ = ('_items',)
+
+    def __init__(self, items):
+        object.__setattr__(self, '_items', dict(items))
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            return self._items[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, key):
+        return self._items[key]
+
+    def keys(self):
+        return self._items.keys()
+
+    def __reduce__(self):
+        return type(self), (self._items,)
+
+
+class Record(ReadOnly):
+    """
+    Read only config object with a fixed set of fields, missing fields are None
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            object.__setattr__(self, field, value)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return [field for field in self.__slots__ if getattr(self, field) is not None]
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, field) for field in self.__slots__)
+
+
+class ColorConfig(Record):
+    __slots__ = ('red', 'green', 'blue')
+
+
+class ButtonConfig(Record):
+    __slots__ = ('color', 'action')
+
+
+class ProfileConfig(Record):
+    __slots__ = ('order', 'buttons')
+
+
+def freeze(value):
+    """
+    Turns parsed YAML into read only config objects: dicts become Sections, lists tuples
+    """
+    if isinstance(value, dict):
+        return Section({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def compile_config(data):
+    """
+    Compiles the parsed YAML <data> into read only config objects
+    """
+    data = dict(data or {})
+
+    profiles = {}
+    for name, profile in (data.get('profiles') or {}).items():
+        buttons = {}
+        for button, config in ((profile or {}).get('buttons') or {}).items():
+            config = config or {}
+            color = config.get('color') or {}
+            buttons[str(button)] = ButtonConfig(
+                ColorConfig(int(color.get('red', 0)), int(color.get('green', 0)), color.get('blue')),
+                freeze(config.get('action') or []))
+        profiles[name] = ProfileConfig(int((profile or {}).get('order', 0)), Section(buttons))
+
+    sections = {key: freeze(value) for key, value in data.items()}
+    sections['profiles'] = Section(profiles)
+    return Section(sections)
+
+
+def parse_config(text):
+    return yaml.load(text, Loader=Loader)
+
+
+def load_config(path=CONFIG_FILE):
+    """
+    Returns the compiled config of <path>.
+    The compiled form is cached by the file's hash, an unchanged file is not parsed again.
+    """
+    with open(path, 'rb') as conf_file:
+        text = conf_file.read()
+
+    digest = hashlib.sha256(CACHE_VERSION + text).hexdigest()
+    cache_path = os.path.join(CACHE_FOLDER, f'config-{digest}.pickle')
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError) as exc:
+        log.warning('Config cache %s is broken: %s', cache_path, exc)
+
+    config = compile_config(parse_config(text))
+
+    for stale in glob.glob(os.path.join(CACHE_FOLDER, 'config-*.pickle')):
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+    try:
+        with open(cache_path, 'wb') as cache_file:
+            pickle.dump(config, cache_file, pickle.HIGHEST_PROTOCOL)
+    except OSError as exc:
+        log.warning('Unable to store config cache %s: %s', cache_path, exc)
+    return config
+
+
+class ConfigWatcher(object):
+    """
+    Polls <path> every <interval> seconds and calls callback(config) with the compiled
+    config when the file changed. A file that fails to parse is logged and skipped,
+    the running config stays as it is until the next good save.
+    """
+
+    def __init__(self, path, callback, interval=WATCH_INTERVAL):
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+
+        self.signature = self.stat()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='config-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+        Reloads the config if the file changed since the last check, returns True if it did
+        """
+        signature = self.stat()
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+
+        try:
+            config = load_config(self.path)
+        except (OSError, yaml.YAMLError, ValueError, TypeError, AttributeError) as exc:
+            log.error('Unable to reload %s: %s', self.path, exc)
+            return False
+
+        log.info('%s changed, reloading', self.path)
+        try:
+            self.callback(config)
+        except Exception:
+            log.exception('Unable to apply the new config')
+        return True
@@ -29,16 +29,18 @@ class LPButton:
 
     @property
     def config(self):
-        return self.parent.config.profiles[self.profile].buttons[f'{self.x}.{self.y}']
+        return self.parent.config.profiles[self.profile].buttons.get(f'{self.x}.{self.y}')
 
     @property
     def tooltip(self):
-        button_data = self.config.toDict().get('action', {})
+        button_data = self.config.to_dict().get('action', {}) if self.config else {}
         return f'Button: {self.x}, {self.y}\nSettings: {button_data}'
 
     @property
     def color(self):
-        color = self.parent.config.profiles[self.profile].buttons[f'{self.x}.{self.y}'].color
+        if self.config is None:
+            return wx.Colour('black')
+        color = self.config.color
 
         red = color.get('red', 0) * (255 / 3)
         green = color.get('green', 0) * (255 / 3)
@@ -113,8 +115,10 @@ class LPItem(wx.Panel):
     def generate_settings(self, button):
         self.label.SetLabel(f'Editing Button {button.x} {button.y}')
 
+        if button.config is None:
+            return
         for action in button.config.action:
-            self.create_control(action.toDict())
+            self.create_control(action.to_dict())
 
     def button_add(self, event):
         pass
@@ -142,14 +146,15 @@ class LPItem(wx.Panel):
 
 
 class MainFrame(wx.Frame):
-    def __init__(self, config, **kwargs):
+    def __init__(self, config, lp=None, **kwargs):
         super().__init__(None, title='pyControlCast', size=wx.Size(700, 335))
 
         self.last_button = None
         self.buttons = {}
         self.config = config
+        self.lp = lp
 
-        self.profile = self.config.get('active_profile', 'default')
+        self.profile = lp.active_profile if lp is not None else self.config.get('active_profile', 'default')
 
         self.sizers = {
             profile: self.create_grid(profile)
@@ -169,7 +174,10 @@ class MainFrame(wx.Frame):
             self.buttons[self.get_id(x, AUTOMAP_ROW, self.profile_list[x])] = button
             automap_sizer.Add(button.create())
         side_sizer.Add(automap_sizer, flag=wx.BOTTOM, border=5)
-        side_sizer.Add(self.sizers[self.profile])
+        # every grid stays in the sizer, which owns them, switching only shows another one
+        for profile, sizer in self.sizers.items():
+            side_sizer.Add(sizer)
+            side_sizer.Show(sizer, profile == self.profile, recursive=True)
 
         self.item_frame = LPItem(self)
 
@@ -179,6 +187,9 @@ class MainFrame(wx.Frame):
         self.SetSizer(main_sizer)
         self.Show(True)
 
+        if self.lp is not None:
+            self.lp.add_profile_listener(self.profile_changed)
+
     @staticmethod
     def get_id(x, y, profile):
         return x, y, profile
@@ -214,22 +225,48 @@ class MainFrame(wx.Frame):
 
     def replace_buttons(self, button):
         profile = button.profile
+        if profile is None:
+            return
         log.info('replacing profile %s', profile)
 
+        if self.lp is not None:
+            # the device switches and calls profile_changed()
+            self.lp.switch_profile(profile)
+        else:
+            self.show_profile(profile)
+
+    def profile_changed(self, profile):
+        # called from the MIDI thread
+        wx.CallAfter(self.show_profile, profile)
+
+    def show_profile(self, profile):
+        if profile == self.profile or profile not in self.sizers:
+            return
+
+        self.sizer.Show(self.sizers[self.profile], False, recursive=True)
+        self.sizer.Show(self.sizers[profile], True, recursive=True)
+        self.profile = profile
+
+        for x in range(GRID_SIZE):
+            self.buttons[self.get_id(x, AUTOMAP_ROW, self.profile_list[x])].reset_color()
+        self.sizer.Layout()
+        self.Layout()
+
 
 class ControlCastGui(object):
-    def __init__(self, config):
+    def __init__(self, config, lp=None):
         # self.app = wx.App(True, filename=os.path.join(LOG_FOLDER, 'main.log'))
         self.app = wx.App(False)
         self.main = None
 
         self.config = config
+        self.lp = lp
 
     def start(self):
-        self.main = MainFrame(self.config)
+        self.main = MainFrame(self.config, self.lp)
         self.app.MainLoop()
 
 
-def init_gui(config):
-    gui = ControlCastGui(config)
+def init_gui(config, lp=None):
+    gui = ControlCastGui(config, lp)
     gui.start()
@@ -1,15 +1,23 @@
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import json
 import logging.handlers
+import multiprocessing
 
 import os
 from time import sleep
 
-import dotmap
-import yaml
-
-from gui.init import init_gui
+from config import load_config, ConfigWatcher, CONFIG_FILE
+from lp import tracing
 from lp.init import init_launchpad
+from lp.startup import report, format_report
 from settings import LOG_FOLDER
 
+IMPORTED = time.perf_counter()
+
 
 LOG_FILE = os.path.join(LOG_FOLDER, 'app.log')
 LOG_FORMAT = logging.Formatter("%(asctime)s [%(threadName) s%(name)s] [%(levelname)s]  %(message)s")
@@ -35,27 +43,65 @@ def setup_logger():
     # logging.getLogger('obswebsocket.core').setLevel(logging.ERROR)
 
 
-def load_config():
-    with open('conf/config.yaml') as conf_file:
-        return yaml.safe_load(conf_file.read())
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='pyControlCast')
+    parser.add_argument('--headless', action='store_true', help='run without the GUI, wx is never imported')
+    parser.add_argument('--startup-report', metavar='FILE',
+                        help='write startup time, import times and memory usage as JSON to FILE')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='record engine activity and write it to FILE in the Chrome trace format on exit')
+    parser.add_argument('--virtual', action='store_true',
+                        help='use a simulated Launchpad instead of a connected one')
+    return parser.parse_args()
+
+
+def startup_report(path, headless):
+    data = report(STARTED, IMPORTED, version=VERSION, headless=headless)
+    log = logging.getLogger('main')
+    log.info(format_report(data))
+    if path:
+        with open(path, 'w') as report_file:
+            json.dump(data, report_file, indent=2)
 
 
 if __name__ == '__main__':
+    # sounds are decoded in spawned processes, see lp.sound.SoundPrewarm
+    multiprocessing.freeze_support()
+    arguments = parse_arguments()
     setup_logger()
 
-    gui_enabled = True
+    gui_enabled = not arguments.headless
 
     log = logging.getLogger('main')
 
-    config = dotmap.DotMap(load_config())
-    lp = init_launchpad(config)
+    config = load_config()
+    if arguments.trace:
+        tracing.enable()
+    midi = None
+    if arguments.virtual:
+        from lp.launchpad import Midi
+        from lp.virtual import VirtualDevice
+        midi = Midi(VirtualDevice('launchpad').backend)
+    lp = init_launchpad(config, midi)
+
+    watcher = ConfigWatcher(CONFIG_FILE, lp.reload)
+    watcher.start()
     if gui_enabled:
-        gui = init_gui(config)
+        from gui.init import init_gui
+        # the report is written before the GUI's main loop takes over
+        startup_report(arguments.startup_report, headless=False)
+        gui = init_gui(config, lp)
+        watcher.stop()
         lp.stop()
     else:
+        startup_report(arguments.startup_report, headless=True)
         try:
             while True:
                 sleep(1)
         except (KeyboardInterrupt, SystemExit):
             log.info("Exiting now")
+            watcher.stop()
             lp.stop()
+
+    if arguments.trace:
+        tracing.dump(arguments.trace)
@@ -0,0 +1,301 @@
+import abc
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger('animation')
+
+DEFAULT_FPS = 30
+
+# MIDI messages per second the animations may use. A DIN MIDI link carries about
+# 1000 three byte messages per second, USB a lot more, so this leaves room for
+# the LEDs set by actions and for the device to keep up with input.
+DEFAULT_BUDGET = 600
+
+
+def mix(start, end, amount):
+    """
+    Returns the color <amount> (0..1) of the way from <start> to <end>, colors are tuples of intensities
+    """
+    return tuple(int(round(a + (b - a) * amount)) for a, b in zip(start, end))
+
+
+class Effect(abc.ABC):
+    """
+    Base class of animations. render() returns the colors of the animated buttons
+    at <elapsed> seconds after the effect started, {(x, y): color}.
+    Colors are tuples in the format of the target: (red, green) 0..3 on the classic
+    Launchpad, (red, green, blue) 0..63 on the Pro and Mk2.
+    An effect with <duration> None runs until it is removed.
+    """
+
+    def __init__(self, duration=None):
+        self.duration = duration
+        self.started = None
+
+    def finished(self, elapsed):
+        return self.duration is not None and elapsed >= self.duration
+
+    @abc.abstractmethod
+    def render(self, elapsed):
+        pass
+
+
+class Fade(Effect):
+    """
+    Fades <positions> from color <start> to <end> in <duration> seconds
+    """
+
+    def __init__(self, positions, start, end, duration=1.0):
+        super(Fade, self).__init__(duration)
+        self.positions = tuple(positions)
+        self.start = start
+        self.end = end
+
+    def render(self, elapsed):
+        color = mix(self.start, self.end, min(elapsed / self.duration, 1.0))
+        return {pos: color for pos in self.positions}
+
+
+class Pulse(Effect):
+    """
+    Pulses <positions> between <low> and <high> once every <period> seconds
+    """
+
+    def __init__(self, positions, high, low, period=1.0, duration=None):
+        super(Pulse, self).__init__(duration)
+        self.positions = tuple(positions)
+        self.high = high
+        self.low = low
+        self.period = period
+
+    def render(self, elapsed):
+        amount = (1 - math.cos(2 * math.pi * elapsed / self.period)) / 2
+        color = mix(self.low, self.high, amount)
+        return {pos: color for pos in self.positions}
+
+
+class Chase(Effect):
+    """
+    Runs a light of <color> along <path>, one step every <step> seconds.
+    The light leaves a tail of <tail> buttons fading to <background>.
+    """
+
+    def __init__(self, path, color, background, step=0.1, tail=2, loops=None):
+        super(Chase, self).__init__(None if loops is None else loops * len(path) * step)
+        self.path = tuple(path)
+        self.color = color
+        self.background = background
+        self.step = step
+        self.tail = tail
+
+    def render(self, elapsed):
+        head = int(elapsed / self.step)
+        cells = {pos: self.background for pos in self.path}
+        for distance in range(self.tail, -1, -1):
+            cells[self.path[(head - distance) % len(self.path)]] = mix(
+                self.color, self.background, distance / (self.tail + 1))
+        return cells
+
+
+class PressFeedback(Fade):
+    """
+    Lights a pressed button in <color> and fades it back to its own color <base>
+    """
+
+    def __init__(self, pos, color, base, duration=0.3):
+        super(PressFeedback, self).__init__((pos,), color, base, duration)
+
+
+class FrameTarget(object):
+    """
+    Draws animations as the overlay of a classic Launchpad's framebuffer.
+    Buttons go back to their framebuffer color as soon as no effect covers them.
+    """
+
+    def __init__(self, lp):
+        self.lp = lp
+
+    def set_base(self, base):
+        # the framebuffer holds the colors below the animations
+        pass
+
+    def render(self, cells, limit):
+        self.lp.frame_overlay(cells)
+        return self.lp.flush(limit=limit)
+
+
+class RGBTarget(object):
+    """
+    Draws animations on a Launchpad Pro or Mk2 through led_ctrl_frame().
+    Buttons no effect covers anymore go back to their color in <base>, {(x, y): color}.
+    """
+
+    def __init__(self, lp, base=None):
+        self.lp = lp
+        self.base = dict(base or {})
+        self.shown = {}
+
+    def set_base(self, base):
+        """
+        Replaces the colors buttons go back to, e.g. with the colors of a new profile
+        """
+        self.base = dict(base)
+
+    def render(self, cells, limit):
+        wanted = dict(cells)
+        for pos in self.shown:
+            if pos not in wanted:
+                wanted[pos] = self.base.get(pos, (0, 0, 0))
+
+        changed = {}
+        for pos, color in wanted.items():
+            if len(changed) >= limit:
+                break
+            if self.shown.get(pos) != color:
+                number = self.lp.led_number_xy(*pos)
+                if number >= 0:
+                    changed[number] = color
+                self.shown[pos] = color
+
+        # buttons back at their base color are no longer animated
+        self.shown = {pos: color for pos, color in self.shown.items()
+                      if pos in cells or color != self.base.get(pos, (0, 0, 0))}
+
+        if not changed:
+            return 0
+        return self.lp.led_ctrl_frame(changed)
+
+
+def get_target(lp):
+    """
+    Returns the animation target for a device, depending on the LED write path it offers
+    """
+    if hasattr(lp, 'frame_overlay'):
+        return FrameTarget(lp)
+    if hasattr(lp, 'led_ctrl_frame'):
+        return RGBTarget(lp)
+    raise ValueError(f'{type(lp).__name__} does not support animations')
+
+
+class Animator(object):
+    """
+    Renders the running effects at a fixed rate of <fps> frames per second on its own thread
+    and sends the changes to <target>. Each frame may use at most <budget> / <fps> messages,
+    changes over that are sent in the following frames.
+    When frames can't be rendered in time they are skipped rather than queued.
+    The thread sleeps while there are no effects.
+    """
+
+    def __init__(self, target, fps=DEFAULT_FPS, budget=DEFAULT_BUDGET):
+        self.target = target
+        self.period = 1.0 / fps
+        self.limit = max(1, int(budget / fps))
+
+        self.effects = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.drawn = False
+
+        self.frames = 0
+        self.skipped = 0
+        self.messages = 0
+        self.render_max = 0.0
+
+    def add(self, effect):
+        """
+        Starts <effect>, returns it so it can be removed later
+        """
+        with self.condition:
+            effect.started = time.perf_counter()
+            self.effects.append(effect)
+            self.condition.notify()
+        return effect
+
+    def remove(self, effect):
+        with self.condition:
+            if effect in self.effects:
+                self.effects.remove(effect)
+
+    def clear(self):
+        with self.condition:
+            self.effects = []
+
+    def set_base(self, base):
+        """
+        Sets the colors of the buttons below the animations, {(x, y): color}
+        """
+        self.target.set_base(base)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='animation', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def run(self):
+        due = time.perf_counter()
+        while True:
+            with self.condition:
+                # nothing to draw and nothing left to clean up
+                while self.running and not self.effects and not self.drawn:
+                    self.condition.wait()
+                    due = time.perf_counter()
+                if not self.running:
+                    break
+
+            now = time.perf_counter()
+            if now - due > self.period:
+                missed = int((now - due) / self.period)
+                self.skipped += missed
+                due += missed * self.period
+
+            self.render(now)
+            due += self.period
+
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def render(self, now):
+        """
+        Draws a single frame of all effects at time <now>, later effects cover earlier ones
+        """
+        with self.condition:
+            cells = {}
+            running = []
+            for effect in self.effects:
+                elapsed = now - effect.started
+                if effect.finished(elapsed):
+                    continue
+                cells.update(effect.render(elapsed))
+                running.append(effect)
+            self.effects = running
+
+        try:
+            sent = self.target.render(cells, self.limit)
+        except Exception:
+            log.exception('Unable to draw animation frame')
+            sent = 0
+
+        # keep drawing until everything the budget held back is sent
+        self.drawn = bool(cells) or sent > 0
+        self.frames += 1
+        self.messages += sent
+        self.render_max = max(self.render_max, time.perf_counter() - now)
+        return sent
+
+    def stats(self):
+        return {
+            'effects': len(self.effects),
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'messages': self.messages,
+            'render_max': self.render_max,
+        }
@@ -0,0 +1,142 @@
+import logging
+import queue
+
+import numpy
+import pyaudio
+
+from lp.sound import FRAME_RATE, CHANNELS
+
+log = logging.getLogger('audio')
+
+BLOCK_SIZE = 256
+MAX_VOICES = 32
+
+
+class Voice(object):
+    __slots__ = ('samples', 'position', 'gain', 'wait')
+
+    def __init__(self, samples, gain=1.0, wait=0):
+        self.samples = samples
+        self.position = 0
+        self.gain = gain
+        self.wait = wait
+
+
+class Mixer(object):
+    """
+    Keeps a single output stream open and mixes all playing sounds into it
+    in blocks of <block_size> frames.
+    Sounds have to be in the format produced by lp.sound.normalize (16 bit, FRAME_RATE, CHANNELS).
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, max_voices=MAX_VOICES, device=None):
+        self.block_size = block_size
+        self.max_voices = max_voices
+        self.device = device
+
+        self.audio = None
+        self.stream = None
+
+        self.voices = []
+        self.pending = queue.SimpleQueue()
+
+        self.mix = numpy.zeros(block_size * CHANNELS, dtype=numpy.float32)
+        self.scratch = numpy.zeros(block_size * CHANNELS, dtype=numpy.float32)
+        self.output = numpy.zeros(block_size * CHANNELS, dtype=numpy.int16)
+
+        self.underruns = 0
+        self.dropped = 0
+
+    def start(self):
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16, channels=CHANNELS, rate=FRAME_RATE, output=True,
+            output_device_index=self.device, frames_per_buffer=self.block_size,
+            stream_callback=self.callback)
+        self.stream.start_stream()
+        log.info('Audio output started, %d frames per block', self.block_size)
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+
+    def play(self, segment, volume=0.0, delay=0.0):
+        """
+        Queues <segment> for playback, <volume> is a gain in dB, <delay> in seconds.
+        Returns the length of the queued sound in seconds.
+        """
+        samples = numpy.frombuffer(segment.raw_data, dtype=numpy.int16)
+        if self.stream is None:
+            log.warning('Audio output is not running, sound skipped')
+            return len(samples) / (FRAME_RATE * CHANNELS)
+
+        gain = 10 ** (volume / 20.0)
+        self.pending.put(Voice(samples, gain, int(delay * FRAME_RATE)))
+        return len(samples) / (FRAME_RATE * CHANNELS)
+
+    def callback(self, in_data, frame_count, time_info, status):
+        if status & pyaudio.paOutputUnderflow:
+            self.underruns += 1
+        return self.render(frame_count), pyaudio.paContinue
+
+    def render(self, frame_count):
+        """
+        Mixes the next <frame_count> frames of all voices and returns them as bytes
+        """
+        while True:
+            try:
+                voice = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if len(self.voices) < self.max_voices:
+                self.voices.append(voice)
+            else:
+                self.dropped += 1
+
+        size = frame_count * CHANNELS
+        if size > len(self.mix):
+            self.mix = numpy.zeros(size, dtype=numpy.float32)
+            self.scratch = numpy.zeros(size, dtype=numpy.float32)
+            self.output = numpy.zeros(size, dtype=numpy.int16)
+
+        mix = self.mix[:size]
+        mix.fill(0)
+
+        playing = []
+        for voice in self.voices:
+            start = 0
+            if voice.wait:
+                skip = min(voice.wait, frame_count)
+                voice.wait -= skip
+                start = skip * CHANNELS
+                if start >= size:
+                    playing.append(voice)
+                    continue
+
+            chunk = voice.samples[voice.position:voice.position + size - start]
+            length = len(chunk)
+            target = mix[start:start + length]
+            if voice.gain == 1.0:
+                numpy.add(target, chunk, out=target)
+            else:
+                scratch = self.scratch[:length]
+                numpy.multiply(chunk, voice.gain, out=scratch)
+                numpy.add(target, scratch, out=target)
+
+            voice.position += length
+            if voice.position < len(voice.samples):
+                playing.append(voice)
+        self.voices = playing
+
+        numpy.clip(mix, -32768, 32767, out=mix)
+        output = self.output[:size]
+        output[:] = mix
+        return output.tobytes()
+
+    def stats(self):
+        return {'voices': len(self.voices), 'underruns': self.underruns, 'dropped': self.dropped}
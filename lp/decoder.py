@@ -0,0 +1,269 @@
+# Table driven decoder for incoming Launchpad MIDI messages.
+#
+# Every device model gets a lookup table built once, mapping (status, data1) to a
+# button index. Decoding a message is a single table lookup and fills either a
+# reusable KeyEvent or preallocated arrays, so the input path does not allocate.
+#
+import array
+
+NOTE_OFF = 128
+NOTE_ON = 144
+CONTROL_CHANGE = 176
+
+# Only channel voice messages with two data bytes reach the table (128..191)
+STATUS_FIRST = 128
+STATUS_LAST = 191
+TABLE_SIZE = (STATUS_LAST - STATUS_FIRST + 1) << 7
+
+BUTTON = 0
+CONTROL = 1
+
+
+class KeyEvent(object):
+    """
+    Decoded input event.
+    <index> is the model's button index, <x>/<y> its position, <number> the raw number
+    used by the legacy Launchpad API, <value> the velocity or controller value.
+    <control> is set for continuous controllers (potentiometers, sliders).
+    """
+    __slots__ = ('index', 'x', 'y', 'number', 'control', 'pressed', 'value', 'timestamp')
+
+    def __init__(self):
+        self.index = -1
+        self.x = 0
+        self.y = 0
+        self.number = 0
+        self.control = False
+        self.pressed = False
+        self.value = 0
+        self.timestamp = 0.0
+
+    @property
+    def pos(self):
+        return self.x, self.y
+
+    def __repr__(self):
+        return f'KeyEvent(index={self.index}, pos={self.pos}, pressed={self.pressed}, value={self.value})'
+
+
+class Decoder(object):
+    def __init__(self, size=128):
+        self.size = size
+
+        self.table = array.array('h', [-1]) * TABLE_SIZE
+        self.release = array.array('B', [0]) * TABLE_SIZE
+
+        self.x = array.array('h', [0]) * size
+        self.y = array.array('h', [0]) * size
+        self.number = array.array('h', [0]) * size
+        self.control = array.array('B', [BUTTON]) * size
+        self.positions = {}
+
+    @staticmethod
+    def key(status, data1):
+        return ((status - STATUS_FIRST) << 7) | data1
+
+    def add(self, status, data1, index, x=None, y=0, number=None, control=BUTTON):
+        """
+        Registers message <status>, <data1> as button <index>.
+        Note off messages are always decoded as a release.
+        """
+        key = self.key(status, data1)
+        self.table[key] = index
+        self.release[key] = (status & 0xf0) == NOTE_OFF
+
+        self.x[index] = index if x is None else x
+        self.y[index] = y
+        self.number[index] = index if number is None else number
+        self.control[index] = control
+        self.positions.setdefault((self.x[index], self.y[index]), index)
+
+    def add_button(self, data1, index, x=None, y=0, number=None, status=NOTE_ON):
+        """
+        Registers a button which sends note on (or <status>) on press and either
+        note on with velocity 0 or note off on release
+        """
+        self.add(status, data1, index, x, y, number)
+        self.add(status - 16, data1, index, x, y, number)
+
+    def lookup(self, status, data1):
+        """
+        Returns the button index of a message, -1 if the model does not know it
+        """
+        if status < STATUS_FIRST or status > STATUS_LAST:
+            return -1
+        return self.table[self.key(status, data1)]
+
+    def index_of(self, x, y):
+        """
+        Returns the button index at position <x>, <y>, -1 if there is no such button
+        """
+        return self.positions.get((x, y), -1)
+
+    def decode(self, message, timestamp=0.0, event=None):
+        """
+        Decodes a raw message [status, data1, data2] into <event>.
+        If <event> is omitted, a new KeyEvent is created.
+        Returns None for messages the model does not use.
+        """
+        if len(message) < 3:
+            return None
+
+        status = message[0]
+        if status < STATUS_FIRST or status > STATUS_LAST:
+            return None
+
+        key = ((status - STATUS_FIRST) << 7) | message[1]
+        index = self.table[key]
+        if index < 0:
+            return None
+
+        value = 0 if self.release[key] else message[2]
+
+        if event is None:
+            event = KeyEvent()
+        event.index = index
+        event.x = self.x[index]
+        event.y = self.y[index]
+        event.number = self.number[index]
+        event.control = self.control[index] == CONTROL
+        event.value = value
+        event.pressed = value > 0 and not event.control
+        event.timestamp = timestamp
+        return event
+
+    def decode_batch(self, messages, indices, values):
+        """
+        Decodes a sequence of raw messages into the preallocated arrays <indices> and <values>.
+        Unknown messages are skipped. Returns the amount of decoded events.
+        For buttons value 0 is a release, everything else a press.
+        """
+        table = self.table
+        release = self.release
+        limit = min(len(indices), len(values))
+
+        count = 0
+        for message in messages:
+            if count >= limit:
+                break
+            if len(message) < 3:
+                continue
+
+            status = message[0]
+            if status < STATUS_FIRST or status > STATUS_LAST:
+                continue
+
+            key = ((status - STATUS_FIRST) << 7) | message[1]
+            index = table[key]
+            if index < 0:
+                continue
+
+            indices[count] = index
+            values[count] = 0 if release[key] else message[2]
+            count += 1
+
+        return count
+
+    @staticmethod
+    def allocate_batch(length):
+        """
+        Returns a pair of arrays suitable for decode_batch()
+        """
+        return array.array('h', [0]) * length, array.array('h', [0]) * length
+
+
+def build_launchpad():
+    # Grid and side buttons use their raw note as index, the automap row is
+    # folded into the unused column 9 of rows 0..7
+    decoder = Decoder(128)
+    for y in range(8):
+        for x in range(9):
+            note = (y << 4) | x
+            decoder.add_button(note, note, x, y)
+
+    for x in range(8):
+        decoder.add(CONTROL_CHANGE, 104 + x, (x << 4) | 9, x, -1, 200 + x)
+    return decoder
+
+
+def build_launchpad_pro():
+    decoder = Decoder(100)
+    for number in range(1, 99):
+        x = (number - 1) % 10
+        y = (99 - number) // 10
+        decoder.add_button(number, number, x, y)
+        decoder.add(CONTROL_CHANGE, number, number, x, y)
+    return decoder
+
+
+def build_launchpad_mk2():
+    decoder = Decoder(112)
+    for number in range(11, 90):
+        decoder.add_button(number, number, (number - 1) % 10, (99 - number) // 10)
+
+    for x in range(8):
+        decoder.add(CONTROL_CHANGE, 104 + x, 104 + x, x, 0)
+    return decoder
+
+
+def build_launch_control_xl():
+    buttons = [number for row in (41, 57, 73, 89) for number in range(row, row + 4)]
+
+    decoder = Decoder(128)
+    for number in buttons:
+        decoder.add_button(number, number)
+
+    for number in range(128):
+        if 104 <= number <= 107:
+            decoder.add(CONTROL_CHANGE, number, number)
+        elif number not in buttons:
+            decoder.add(CONTROL_CHANGE, number, number, control=CONTROL)
+    return decoder
+
+
+def build_launchkey_mini():
+    # keys, drum pads and controllers all overlap in their raw numbers,
+    # so they get 3 separate index ranges: keys 0..127, pads 128..255, CC 256..383
+    decoder = Decoder(384)
+    for number in range(128):
+        decoder.add_button(number, number, number=number)
+
+    for number in range(36, 52):
+        decoder.add_button(number, 128 + number, number, number=number, status=153)
+
+    for number in range(128):
+        control = BUTTON if 104 <= number <= 109 else CONTROL
+        decoder.add(CONTROL_CHANGE, number, 256 + number, number, number=number, control=control)
+    return decoder
+
+
+def build_dicer():
+    # index is the legacy "decade" numbering: 1..10, 11..20, 21..30 for master, +100 for slave
+    decoder = Decoder(131)
+    for page in range(3):
+        for number in range(60, 70):
+            decoder.add_button(number, number - 59 + 10 * page, status=154 + page)
+            decoder.add_button(number, number - 59 + 100 + 10 * page, status=157 + page)
+    return decoder
+
+
+BUILDERS = {
+    'launchpad': build_launchpad,
+    'launchpad_pro': build_launchpad_pro,
+    'launchpad_mk2': build_launchpad_mk2,
+    'launch_control_xl': build_launch_control_xl,
+    'launchkey_mini': build_launchkey_mini,
+    'dicer': build_dicer,
+}
+
+_decoders = {}
+
+
+def get_decoder(model):
+    """
+    Returns the (cached) decoder for a device <model>, see BUILDERS for names
+    """
+    decoder = _decoders.get(model)
+    if decoder is None:
+        decoder = _decoders[model] = BUILDERS[model]()
+    return decoder
@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+
+from lp import tracing
+
+log = logging.getLogger('executor')
+
+# lower runs first, the OBS loop orders its actions by the same priorities
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# action type -> worker count and queue limit
+DEFAULT_POOLS = {
+    'keyboard': {'workers': 1, 'queue': 16},
+    'sound': {'workers': 2, 'queue': 32},
+}
+
+
+class Pool(object):
+    """
+    Fixed amount of worker threads for one action type.
+    Queued tasks run by priority first, then in submission order.
+    """
+
+    def __init__(self, name, workers=1, max_queue=32):
+        self.name = name
+        self.max_queue = max_queue
+
+        self.tasks = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.running = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        self.threads = [
+            threading.Thread(target=self.work, name=f'{name}-{index}', daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, priority, func, args, kwargs):
+        with self.lock:
+            depth = self.tasks.qsize()
+            if depth >= self.max_queue:
+                self.dropped += 1
+                log.warning('%s queue is full, action dropped', self.name)
+                return False
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, depth + 1)
+
+        self.tasks.put((priority, next(self.counter), time.perf_counter(), func, args, kwargs))
+        return True
+
+    def work(self):
+        while True:
+            priority, _, submitted, func, args, kwargs = self.tasks.get()
+            if func is None:
+                break
+
+            wait = time.perf_counter() - submitted
+            with self.lock:
+                self.running += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+
+            started = tracing.tracer.begin()
+            try:
+                func(*args, **kwargs)
+                failed = False
+            except Exception:
+                log.exception('%s action failed', self.name)
+                failed = True
+            tracing.tracer.end(self.name, 'action', started, {'wait_ms': round(wait * 1000, 3)})
+
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.failed += failed
+
+    def stop(self):
+        for _ in self.threads:
+            self.tasks.put((PRIORITY_LOW + 1, next(self.counter), 0, None, (), {}))
+
+    def stats(self):
+        with self.lock:
+            started = self.completed + self.running
+            return {
+                'queued': self.tasks.qsize(),
+                'max_queued': self.max_depth,
+                'running': self.running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'wait_avg': self.wait_total / started if started else 0.0,
+                'wait_max': self.wait_max,
+            }
+
+
+class ActionExecutor(object):
+    """
+    Runs actions on bounded per action type pools instead of a thread per press.
+    Delayed actions are kept by a single timer thread until they are due.
+    """
+
+    def __init__(self, pools=None):
+        self.pools = {}
+        for name, config in dict(DEFAULT_POOLS, **(pools or {})).items():
+            self.add_pool(name, config.get('workers', 1), config.get('queue', 32))
+
+        self.timers = []
+        self.timer_counter = itertools.count()
+        self.timer_condition = threading.Condition()
+        self.running = True
+        self.timer_thread = threading.Thread(target=self.timer_loop, name='executor-timer', daemon=True)
+        self.timer_thread.start()
+
+    def add_pool(self, name, workers=1, max_queue=32):
+        self.pools[name] = Pool(name, workers, max_queue)
+
+    def submit(self, pool, func, *args, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        Queues func(*args, **kwargs) on <pool>. Returns False if the pool's queue is full.
+        """
+        return self.pools[pool].submit(priority, func, args, kwargs)
+
+    def submit_later(self, pool, delay, func, *args, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        Queues func(*args, **kwargs) on <pool> after <delay> seconds, without holding a worker
+        """
+        due = time.perf_counter() + delay
+        with self.timer_condition:
+            heapq.heappush(self.timers, (due, next(self.timer_counter), pool, priority, func, args, kwargs))
+            self.timer_condition.notify()
+
+    def call_later(self, delay, func, *args, **kwargs):
+        """
+        Calls func(*args, **kwargs) on the timer thread after <delay> seconds. It is never dropped,
+        so it must be short and not block, like turning an LED off.
+        """
+        self.submit_later(None, delay, func, *args, **kwargs)
+
+    def next_timer(self):
+        """
+        Waits for the next due timer and returns it, None once stopped
+        """
+        with self.timer_condition:
+            while self.running:
+                if not self.timers:
+                    self.timer_condition.wait()
+                    continue
+
+                delay = self.timers[0][0] - time.perf_counter()
+                if delay > 0:
+                    self.timer_condition.wait(delay)
+                    continue
+
+                return heapq.heappop(self.timers)
+        return None
+
+    def timer_loop(self):
+        while True:
+            timer = self.next_timer()
+            if timer is None:
+                break
+
+            _, _, pool, priority, func, args, kwargs = timer
+            if pool is not None:
+                self.pools[pool].submit(priority, func, args, kwargs)
+                continue
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                log.exception('Timer call failed')
+
+    def stop(self):
+        with self.timer_condition:
+            self.running = False
+            self.timer_condition.notify()
+        for pool in self.pools.values():
+            pool.stop()
+
+    def stats(self):
+        with self.timer_condition:
+            timers = len(self.timers)
+        stats = {name: pool.stats() for name, pool in self.pools.items()}
+        stats['timers'] = timers
+        return stats
@@ -1,157 +1,631 @@
+import functools
+import inspect
 import logging
-import random
+import os
 import threading
 
-import pyautogui
-from pydub import AudioSegment
-from pydub.playback import play
-
 import time
 
-from lp import launchpad
-from lp.obs_websocket import OBS
+from lp import launchpad, tracing
+from lp.animation import Animator, PressFeedback, get_target, DEFAULT_FPS, DEFAULT_BUDGET
+from lp.decoder import KeyEvent
+from lp.executor import ActionExecutor, PRIORITY_LOW
+from lp.metrics import Metrics, MetricsServer, NULL_PRESS, DEFAULT_HOST
+from lp.startup import import_backend
 
 KEY_UP = 0
 KEY_DOWN = 127
 
+PREWARM_COLOR = (1, 1)
+PREWARM_FAILED_COLOR = (3, 0)
+
+PRESS_COLOR = (3, 3)
+PRESS_DURATION = 0.3
+
+ACTIVE_PROFILE_COLOR = (3, 0)
+PROFILE_COLOR = (0, 3)
+
+
+def plain(value):
+    """
+    Returns config <value> as plain dicts and lists, for comparing two configs
+    """
+    return value.to_dict() if hasattr(value, 'to_dict') else value
+
+
+class Profile(object):
+    """
+    Compiled state of a profile: the dispatch table indexed by button index,
+    the configured buttons by position and the LED frame shown while it is active
+    """
+    __slots__ = ('name', 'dispatch', 'buttons', 'frame', 'sounds')
+
+    def __init__(self, name, size, frame):
+        self.name = name
+        self.dispatch = [None] * size
+        self.buttons = {}
+        self.frame = frame
+        self.sounds = {}
+
 
 # ffmpeg: -loglevel panic -hide_banner -nostats
 class Launchpad(object):
-    def __init__(self, config):
+    def __init__(self, config, midi=None):
         self.reading_thread = None
 
-        self.lp = launchpad.Launchpad()
+        # tracing starts before the device opens, so its first LED writes are in the trace
+        tracing_config = config.get('tracing', {})
+        if tracing_config.get('enabled', False):
+            tracing.enable(tracing_config.get('size', tracing.DEFAULT_SIZE))
+        self.trace_file = tracing_config.get('file')
+
+        # <midi> replaces the rtmidi2 ports, e.g. with a simulated device from lp.virtual
+        self.lp = launchpad.Launchpad(midi)
         self.lp.open()
 
+        self.decoder = self.lp.decoder
+        self.event = KeyEvent()
+
         self.obs = None
 
         self.config = config
         self.buttons = {}
+        self.profiles = {}
+        self.profile = None
+        self.profile_listeners = []
+        self.switch_time = 0.0
+        self.switch_max = 0.0
+
+        # flashing is not part of the compiled frames, it's applied again after every switch and reload
+        self.flashing = set()
+        self.obs_connected = True
+
+        self.executor = ActionExecutor(self.config.get('executor'))
+
+        metrics_config = self.config.get('metrics', {})
+        self.metrics = Metrics(metrics_config.get('enabled', True))
+        self.metrics_server = None
+        if metrics_config.get('port') is not None:
+            self.metrics_server = MetricsServer(self.metrics, int(metrics_config.get('port')),
+                                                metrics_config.get('host', DEFAULT_HOST))
+
+        # action backends are set up by the first bound action of their type, see require()
+        self.keyboard = None
+        self.sound_cache = None
+        self.sound_prewarm = None
+        self.mixer = None
+        self.dispatch = [None] * self.decoder.size
+
+        animation_config = self.config.get('animation', {})
+        self.animator = Animator(get_target(self.lp), animation_config.get('fps', DEFAULT_FPS),
+                                 animation_config.get('budget', DEFAULT_BUDGET))
+        self.press_feedback = animation_config.get('press_feedback', True)
+        self.animator.start()
 
         self.actions = {
             'keyboard': self.keyboard_press,
             'sound': self.play_sound,
             'obs': self.obs_websocket
         }
+        self.action_arguments = {
+            'keyboard': self.keyboard_arguments,
+            'sound': self.sound_arguments,
+            'obs': self.obs_arguments
+        }
+        self.backends = {
+            'keyboard': self.load_keyboard,
+            'sound': self.load_sound,
+            'obs': self.load_obs
+        }
+        self.loaded = set()
 
         if self.lp.id_in:
             self.lp.reset()
         else:
             Exception('Unable to connect to MIDI controller')
 
-        self.bind_buttons(self.config.active_profile)
-        threading.Thread(target=self.setup_obs, daemon=True).start()
+        self.bind_buttons()
+        self.switch_profile(self.config.active_profile)
+
+    def require(self, action):
+        """
+        Imports and starts the backend of <action> type, once
+        """
+        if action not in self.loaded:
+            self.backends[action]()
+            self.loaded.add(action)
+
+    def load_keyboard(self):
+        self.keyboard = import_backend('pyautogui')
+
+    def load_sound(self):
+        sound = import_backend('lp.sound')
+        audio = import_backend('lp.audio')
+
+        sound_config = self.config.get('sound', {})
+        self.sound_cache = sound.SoundCache(sound_config.get('cache_mb', sound.DEFAULT_BUDGET_MB) * 1024 * 1024)
+        self.sound_prewarm = sound.SoundPrewarm(self.sound_cache, sound_config.get('prewarm_workers'))
+
+        self.mixer = audio.Mixer(sound_config.get('block_size', audio.BLOCK_SIZE), device=sound_config.get('device'))
+        try:
+            self.mixer.start()
+        except OSError as exc:
+            logging.error('Unable to open audio output: %s', exc)
+
+    def load_obs(self):
+        self.obs = import_backend('lp.obs_websocket').OBS(self.config, self.obs_status)
 
     @staticmethod
-    def keyboard_press(keys):
-        threading.Thread(target=pyautogui.hotkey, args=keys, kwargs={'interval': 0.05}).start()
+    def keyboard_arguments(keys):
+        if isinstance(keys, str):
+            keys = [keys]
+        if not keys or not all(isinstance(key, str) for key in keys):
+            raise ValueError(f'keyboard: keys should be a list of key names, got {keys}')
+        return {'keys': tuple(keys)}
+
+    def keyboard_press(self, keys):
+        press = self.metrics.begin('keyboard')
+        if not self.executor.submit('keyboard', press.call, self.send_hotkey, keys, press):
+            press.drop()
+
+    def send_hotkey(self, keys, press=NULL_PRESS):
+        self.keyboard.hotkey(*keys, interval=0.05)
+        press.mark('backend')
+        press.finish()
 
-    def play_sound(self, path=None, volume=0, delay=0):
+    @staticmethod
+    def sound_arguments(path, volume=0, delay=0):
         if isinstance(path, str):
             path = [path]
-        if isinstance(volume, int):
-            volume = [volume]
-        threading.Thread(target=self.play_sounds_thread, args=[path, volume, delay]).start()
+        if isinstance(volume, (int, float)):
+            volume = [volume] * len(path)
+        if len(path) != len(volume):
+            raise ValueError(f'sound: {len(path)} paths but {len(volume)} volumes')
+        # missing files don't stop the profile from loading, see compile_button()
+        return {'path': tuple(path), 'volume': tuple(float(item) for item in volume), 'delay': float(delay)}
+
+    def play_sound(self, path, volume, delay, pos=None):
+        press = self.metrics.begin('sound')
+        if all(item in self.sound_cache for item in path):
+            self.queue_sounds(path, volume, delay, pos, press)
+        else:
+            # not pre-warmed, decode outside of the MIDI thread
+            if not self.executor.submit('sound', press.call, self.queue_sounds, path, volume, delay, pos, press,
+                                        priority=PRIORITY_LOW):
+                press.drop()
 
-    @staticmethod
-    def play_sounds_thread(paths, volumes, delay):
-        if delay:
-            time.sleep(delay)
+    def queue_sounds(self, paths, volumes, delay, pos=None, press=NULL_PRESS):
+        # sounds of one button play one after another
         for path, volume in zip(paths, volumes):
-            song = AudioSegment.from_mp3(path)
-            play(song + volume)
+            delay += self.mixer.play(self.sound_cache.get(path), volume, delay)
+        press.mark('backend')
+
+        if pos is not None and pos in self.buttons:
+            self.flash_button(pos, True)
+            # not queued on the sound pool, a full queue must not leave the button flashing
+            self.executor.call_later(delay, self.flash_button, pos, False)
+        press.finish()
+
+    def flash_button(self, pos, flash):
+        """
+        Starts or stops hardware flashing of the button at <pos> in its configured color,
+        in whatever profile is active until it stops
+        """
+        if flash:
+            self.flashing.add(pos)
+        else:
+            self.flashing.discard(pos)
+        self.show_flashing(pos)
+        self.lp.flush()
+
+    def obs_status(self, connected):
+        self.obs_connected = connected
+        pos = self.profile_button()
+        if pos is not None:
+            self.show_flashing(pos)
+            self.lp.flush()
+
+    def profile_button(self):
+        """
+        Returns the position of the active profile's button
+        """
+        if self.profile is None:
+            return None
+        return int(self.config.profiles[self.profile.name].order), -1
+
+    def is_flashing(self, pos):
+        # the active profile's button flashes while OBS can't be reached
+        return pos in self.flashing or not self.obs_connected and pos == self.profile_button()
+
+    def show_flashing(self, pos):
+        """
+        Sets the button at <pos> in the frame to its configured color, flashing if it should
+        """
+        button = self.buttons.get(pos)
+        if button is not None:
+            self.lp.frame_set(*pos, button['red'], button['green'], flash=self.is_flashing(pos))
+
+    def apply_flashing(self):
+        """
+        Sets all buttons that should flash in the frame, after it was replaced or redrawn
+        """
+        positions = set(self.flashing)
+        if not self.obs_connected:
+            positions.add(self.profile_button())
+        for pos in positions:
+            self.show_flashing(pos)
 
-    def obs_websocket(self, request, **kwargs):
-        if self.obs:
-            threading.Thread(target=getattr(self.obs, request), kwargs=kwargs).start()
+    @staticmethod
+    def obs_arguments(request, **kwargs):
+        OBS = import_backend('lp.obs_websocket').OBS
+        if request not in OBS.ACTIONS:
+            raise ValueError(f'obs: unknown request {request}')
+        try:
+            inspect.signature(getattr(OBS, request)).bind(None, **kwargs)
+        except TypeError as exc:
+            raise ValueError(f'obs: {request}: {exc}')
+        return {'request': request, **kwargs}
 
-    def switch_profile(self, profile):
-        pass
+    def obs_websocket(self, request, **kwargs):
+        self.obs.run(request, press=self.metrics.begin('obs'), **kwargs)
 
-    @staticmethod
-    def get_key_info(data):
-        logging.debug(data)
-        y = (data[1] // 16)
-        x = (data[1] % 16)
-
-        if data[0] == 176:
-            y = y - 7
-            x = x - 8
-
-        return {
-            'is_pressed': data[2] == KEY_DOWN or False,
-            'pos': (x, y),
-            'automap': data[0] == 176 or False
-        }
+    @property
+    def active_profile(self):
+        return self.profile.name if self.profile is not None else None
 
-    def set_key_data(self, data):
-        if data['automap']:
-            pass
-            self.lp.led_ctrl_automap(data['pos'][1] - 8, random.randint(0, 3), random.randint(0, 3))
-        else:
-            key_number = (16 * data['pos'][0]) + data['pos'][1]
-            self.lp.led_ctrl_raw(key_number, random.randint(0, 3), random.randint(0, 3))
+    def add_profile_listener(self, listener):
+        """
+        <listener> is called as listener(profile) after every profile switch, from the switching thread
+        """
+        self.profile_listeners.append(listener)
 
-    def process_key(self, data):
-        if not data['is_pressed']:
+    def switch_profile(self, profile):
+        """
+        Makes the precompiled <profile> active: swaps the dispatch table and
+        sends the difference between the current and the profile's LED frame
+        """
+        compiled = self.profiles.get(profile)
+        if compiled is None:
+            logging.warning('Unknown profile %s', profile)
             return
-        action = self.buttons.get(data['pos'], {}).get('action', {})
-        logging.info(f'Processing button {data["pos"]}, action: {action}, automap: {data["automap"]}')
-
-        if action:
-            # return
-            self.process_action(action)
 
-    def process_action(self, actions):
-        for action_key in actions:
-            action, config = list(action_key.items())[0]
-            if action in self.actions:
-                self.actions[action](**config)
+        started = time.perf_counter()
+        with self.lp.frame_lock:
+            self.profile = compiled
+            self.dispatch = compiled.dispatch
+            self.buttons = compiled.buttons
+            self.lp.frame = list(compiled.frame)
+            self.apply_flashing()
+        sent = self.lp.flush(swap=True)
+        self.animator.set_base(self.button_colors())
+
+        self.switch_time = time.perf_counter() - started
+        self.switch_max = max(self.switch_max, self.switch_time)
+        logging.info('Switched to profile %s in %.3f ms, %d LED messages', profile, self.switch_time * 1000, sent)
+
+        for listener in self.profile_listeners:
+            try:
+                listener(profile)
+            except Exception:
+                logging.exception('Profile listener failed')
+
+    def button_colors(self):
+        """
+        Returns the configured colors of the active profile's buttons, {(x, y): (red, green)}
+        """
+        return {pos: (button['red'], button['green']) for pos, button in self.buttons.items()}
+
+    def compile_action(self, action_key, pos=None):
+        """
+        Turns a single configured action {name: {arguments}} into a callable with
+        validated and converted arguments. Raises ValueError for bad actions.
+        <pos> is the button the action is bound to, used for LED feedback.
+        """
+        if len(action_key) != 1:
+            raise ValueError(f'Action should have exactly one type, got {list(action_key)}')
+        action, config = list(action_key.items())[0]
+        if action not in self.actions:
+            raise ValueError(f'Unknown action {action}')
+        self.require(action)
+
+        config = dict(config or {})
+        try:
+            arguments = self.action_arguments[action](**config)
+        except TypeError as exc:
+            raise ValueError(f'{action}: {exc}')
+        if action == 'sound':
+            # the button flashes while its sound plays
+            arguments['pos'] = pos
+        return functools.partial(self.actions[action], **arguments)
+
+    def compile_actions(self, actions, pos=None):
+        """
+        Compiles the action list of a button into a single callable
+        """
+        compiled = tuple(self.compile_action(action_key, pos) for action_key in actions)
+        if not compiled:
+            return None
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def run_all():
+            for action in compiled:
+                action()
+        return run_all
+
+    def set_key_data(self, event):
+        button = self.buttons.get(event.pos)
+        if button is not None:
+            self.animator.add(PressFeedback(
+                event.pos, PRESS_COLOR, (button['red'], button['green']), PRESS_DURATION))
+
+    def process_key(self, event, press=NULL_PRESS):
+        action = self.dispatch[event.index]
+        if action is not None:
+            logging.info('Processing button %s', event.pos)
+            press.mark('dispatched')
+            action()
+
+    def handle_message(self, data, timestamp=0.0):
+        received = time.perf_counter()
+        event = self.decoder.decode(data, timestamp, self.event)
+        if event is not None and event.pressed:
+            press = self.metrics.press(timestamp, received)
+            started = tracing.tracer.begin()
+            try:
+                self.process_key(event, press)
+            finally:
+                self.metrics.done(press)
+                tracing.tracer.end('dispatch', 'engine', started, {'button': event.pos})
+            if self.press_feedback:
+                self.set_key_data(event)
 
     def read(self):
         while True:
             data = self.lp.midi.read_raw()
             if data:
-                key_data = self.get_key_info(data)
-                logging.debug(key_data)
-                if key_data['is_pressed']:
-                    self.process_key(key_data)
+                self.handle_message(data)
             else:
                 time.sleep(0.001)
 
-    def stop(self):
-        self.lp.reset()
+    def start(self):
+        if self.metrics_server is not None:
+            self.metrics_server.start()
 
-    def configure_button(self, x, y, red, green, action):
-        if (x, y) not in self.buttons:
-            self.buttons[(x, y)] = {'red': red, 'green': green, 'action': action}
-            self.lp.led_ctrl_xy(x, y, red, green)
+        polling = self.config.get('midi', {}).get('polling', False)
+        if not polling and self.lp.midi.set_callback(self.handle_message):
+            logging.info('Reading MIDI input using driver callback')
+            return
 
-    def bind_buttons(self, profile):
-        for profile_name, profile_item in self.config.profiles.items():
-            if self.config.active_profile == profile_name:
-                self.configure_button(int(profile_item.order), -1, 3, 0, 'switch_profile')
-            else:
-                self.configure_button(int(profile_item.order), -1, 0, 3, 'switch_profile')
+        logging.info('Reading MIDI input using polling')
+        self.reading_thread = threading.Thread(target=self.read, daemon=True)
+        self.reading_thread.start()
 
-        for button, config in self.config.profiles[profile]['buttons'].items():
-            x, y = button.split('.')
-            red = config['color']['red']
-            green = config['color']['green']
-            action = config['action']
-            self.configure_button(int(x), int(y), int(red), int(green), action)
+    def stop(self):
+        self.lp.midi.clear_callback()
+        self.animator.stop()
+        if self.sound_prewarm is not None:
+            self.sound_prewarm.stop()
+        if self.mixer is not None:
+            self.mixer.stop()
+        self.executor.stop()
+        if self.obs is not None:
+            self.obs.close()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.lp.reset()
+        if self.trace_file:
+            self.lp.midi.drain()
+            tracing.dump(self.trace_file)
+
+    def configure_button(self, profile, x, y, red, green, action):
+        if (x, y) not in profile.buttons:
+            index = self.decoder.index_of(x, y)
+            if index < 0:
+                raise ValueError(f'Button {x}.{y} does not exist on this device')
+
+            profile.buttons[(x, y)] = {'red': red, 'green': green, 'action': action}
+            profile.dispatch[index] = action
+            profile.frame[self.lp.frame_index(x, y)] = self.lp.led_get_color(red, green)
+
+    def set_button_color(self, profile, pos, red, green):
+        """
+        Changes the LED of <pos> in the frame of <profile>, and on the device if the profile is active
+        """
+        profile.frame[self.lp.frame_index(*pos)] = self.lp.led_get_color(red, green)
+        if profile is self.profile:
+            self.lp.frame_set(*pos, red, green, flash=self.is_flashing(pos))
+            self.lp.flush()
+
+    def compile_profile(self, name):
+        """
+        Compiles the dispatch table and the LED frame of profile <name>, including the automap row
+        """
+        profile = Profile(name, self.decoder.size, [self.lp.led_get_color(0, 0)] * self.lp.FRAME_SIZE)
 
-    def setup_obs(self):
-        while True:
+        for profile_name, profile_item in self.config.profiles.items():
+            action = functools.partial(self.switch_profile, profile_name)
+            color = ACTIVE_PROFILE_COLOR if profile_name == name else PROFILE_COLOR
+            self.configure_button(profile, int(profile_item.order), -1, *color, action)
+
+        for button, config in self.config.profiles[name]['buttons'].items():
+            pos, red, green, action, paths, failed = self.compile_button(name, button, config)
+            self.configure_button(profile, *pos, red, green, action)
+            if failed:
+                profile.frame[self.lp.frame_index(*pos)] = self.lp.led_get_color(*PREWARM_FAILED_COLOR)
+            if paths:
+                profile.sounds[pos] = paths
+        return profile
+
+    def compile_button(self, profile_name, button, config):
+        """
+        Returns position, color, compiled action, sound paths and whether a sound file is missing
+        of a configured <button> ("x.y"). Such a button is still bound and shows PREWARM_FAILED_COLOR.
+        """
+        x, y = button.split('.')
+        pos = (int(x), int(y))
+        try:
+            action = self.compile_actions(config['action'], pos)
+        except ValueError as exc:
+            raise ValueError(f'Profile {profile_name}, button {button}: {exc}')
+        red = int(config['color']['red'])
+        green = int(config['color']['green'])
+
+        paths = self.action_sounds(config['action'])
+        missing = [path for path in paths if not os.path.isfile(path)]
+        if missing:
+            logging.error('Profile %s, button %s: sound file %s does not exist',
+                          profile_name, button, ', '.join(missing))
+        return pos, red, green, action, paths, bool(missing)
+
+    def bind_buttons(self):
+        """
+        Compiles all profiles up front, so switching between them is a pointer swap
+        """
+        self.profiles = {name: self.compile_profile(name) for name in self.config.profiles}
+
+        if self.config.get('sound', {}).get('prewarm', True):
+            for profile in self.profiles.values():
+                self.prewarm_sounds(profile)
+
+    def reload(self, config):
+        """
+        Applies a changed <config> while MIDI and OBS stay connected.
+        Only buttons whose action or color changed are compiled again, redrawn and have
+        their sounds pre-warmed. Added, removed or reordered profiles rebuild all profiles.
+        Raises ValueError for a bad button, the running config is left as it was then.
+        """
+        old = self.config
+        for section in set(old.keys()) | set(config.keys()):
+            if section not in ('profiles', 'active_profile') and \
+                    plain(old.get(section)) != plain(config.get(section)):
+                logging.warning('Config section %s changed, restart to apply it', section)
+
+        def layout(item):
+            return {name: int(profile.order) for name, profile in item.profiles.items()}
+
+        if layout(old) != layout(config):
+            self.config = config
             try:
-                self.obs = OBS(self.config)
-                break
-            except:
-                logging.info('Unable to connect to OBS, check your settings')
-                time.sleep(5)
+                profiles = {name: self.compile_profile(name) for name in config.profiles}
+            except ValueError:
+                self.config = old
+                raise
+            self.profiles = profiles
+            if self.config.get('sound', {}).get('prewarm', True):
+                for profile in profiles.values():
+                    self.prewarm_sounds(profile)
+
+            active = self.active_profile if self.active_profile in profiles else config.active_profile
+            logging.info('Profiles changed, rebuilt %d profiles', len(profiles))
+            self.switch_profile(active)
+            return
 
+        # compile everything first, so a bad button does not leave a half applied config.
+        # Compiling reads the new config, e.g. the settings of a backend loaded for a new action type.
+        self.config = config
+        changes = []
+        try:
+            for name, profile in self.profiles.items():
+                old_buttons = plain(old.profiles[name].buttons) or {}
+                new_buttons = plain(config.profiles[name].buttons) or {}
+                for button in set(old_buttons) | set(new_buttons):
+                    if old_buttons.get(button) == new_buttons.get(button):
+                        continue
+                    compiled = None
+                    if button in new_buttons:
+                        compiled = self.compile_button(name, button, config.profiles[name].buttons[button])
+                    changes.append((profile, button, compiled))
+        except ValueError:
+            self.config = old
+            raise
+
+        sounds = {}
+        for profile, button, compiled in changes:
+            pos = tuple(int(item) for item in button.split('.'))
+            profile.buttons.pop(pos, None)
+            profile.sounds.pop(pos, None)
+
+            if compiled is None:
+                index = self.decoder.index_of(*pos)
+                if index >= 0:
+                    profile.dispatch[index] = None
+                red, green = 0, 0
+                profile.frame[self.lp.frame_index(*pos)] = self.lp.led_get_color(red, green)
+            else:
+                _, red, green, action, paths, failed = compiled
+                self.configure_button(profile, *pos, red, green, action)
+                if failed:
+                    red, green = PREWARM_FAILED_COLOR
+                    profile.frame[self.lp.frame_index(*pos)] = self.lp.led_get_color(red, green)
+                if paths:
+                    profile.sounds[pos] = paths
+                    sounds.setdefault(profile, {})[pos] = paths
+
+            if profile is self.profile:
+                self.lp.frame_set(*pos, red, green)
+
+        self.apply_flashing()
+        sent = self.lp.flush()
+        self.animator.set_base(self.button_colors())
+        if self.config.get('sound', {}).get('prewarm', True):
+            for profile, profile_sounds in sounds.items():
+                self.prewarm_sounds(profile, profile_sounds)
+        logging.info('Config reloaded, %d buttons changed, %d LED messages', len(changes), sent)
 
-def init_launchpad(config):
-    lp = Launchpad(config)
-    threading.Thread(target=lp.read, daemon=True).start()
+    @staticmethod
+    def action_sounds(actions):
+        paths = []
+        for action_key in actions:
+            sound = action_key.get('sound')
+            if sound:
+                path = sound.get('path')
+                paths.extend([path] if isinstance(path, str) else path)
+        return paths
+
+    def prewarm_sounds(self, profile, sounds=None):
+        """
+        Decodes the sounds of all buttons of <profile>, or only <sounds> {pos: paths}, in the background.
+        Buttons show PREWARM_COLOR while their sounds load and PREWARM_FAILED_COLOR
+        if one of them could not be decoded.
+        """
+        if sounds is None:
+            sounds = profile.sounds
+        if not sounds:
+            return
+        waiting = {pos: set(paths) for pos, paths in sounds.items()}
+        failed = set()
+        lock = threading.Lock()
+
+        def sound_ready(path, error):
+            with lock:
+                finished = []
+                for pos, paths in waiting.items():
+                    if path in paths:
+                        paths.discard(path)
+                        if error is not None:
+                            failed.add(pos)
+                        if not paths:
+                            finished.append(pos)
+                for pos in finished:
+                    del waiting[pos]
+
+            for pos in finished:
+                if pos in failed:
+                    self.set_button_color(profile, pos, *PREWARM_FAILED_COLOR)
+                else:
+                    self.set_button_color(profile, pos, profile.buttons[pos]['red'], profile.buttons[pos]['green'])
+
+        for pos in sounds:
+            profile.frame[self.lp.frame_index(*pos)] = self.lp.led_get_color(*PREWARM_COLOR)
+            if profile is self.profile:
+                self.lp.frame_set(*pos, *PREWARM_COLOR)
+        if sounds and profile is self.profile:
+            self.lp.flush()
+        self.sound_prewarm.prewarm([path for paths in sounds.values() for path in paths], sound_ready)
+
+
+def init_launchpad(config, midi=None):
+    lp = Launchpad(config, midi)
+    lp.start()
     return lp
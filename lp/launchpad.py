@@ -1,16 +1,27 @@
 # A Novation Launchpad control suite for Python.
 # Refactored https://github.com/dhilowitz/launchpad_rtmidi2.py to support Python3 and PEP8
 #
+import collections
 import logging
+import threading
 import time
 
-import rtmidi2
+from lp import tracing
+from lp.decoder import get_decoder
+from lp.startup import import_backend
 
 log = logging.getLogger()
 
 
-def search_input_devices(name, quiet=True):
-    midi = rtmidi2.MidiIn()
+def midi_backend(backend=None):
+    """
+    Returns the module (or object) providing MidiIn and MidiOut, rtmidi2 unless <backend> is given
+    """
+    return backend if backend is not None else import_backend('rtmidi2')
+
+
+def search_input_devices(name, quiet=True, backend=None):
+    midi = midi_backend(backend).MidiIn()
     for index, port in enumerate(midi.ports):
         if not quiet:
             log.info(f'{port}, 1, 0)')
@@ -18,8 +29,8 @@ def search_input_devices(name, quiet=True):
             yield index
 
 
-def search_output_devices(name, quiet=True):
-    midi = rtmidi2.MidiOut()
+def search_output_devices(name, quiet=True, backend=None):
+    midi = midi_backend(backend).MidiOut()
     for index, port in enumerate(midi.ports):
         if not quiet:
             log.info(f'{port}, 1, 0)')
@@ -28,28 +39,174 @@ def search_output_devices(name, quiet=True):
 
 
 class Midi(object):
-    def __init__(self):
-        self.dev_in: rtmidi2.MidiIn = None
-        self.dev_out: rtmidi2.MidiOut = None
+    """
+    Output is written by a single writer thread which owns the MIDI output device.
+    Writes are queued and return at once. While a write waits in the queue, a newer write
+    to the same LED (note on, or control change 104+) replaces it, so only the last color is sent.
+    Every other message keeps its place and is never reordered with the LED writes around it.
+    <backend> provides the MidiIn and MidiOut classes, rtmidi2 by default, see lp.virtual for a simulated one.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = midi_backend(backend)
+        self.dev_in = None  # backend.MidiIn
+        self.dev_out = None  # backend.MidiOut
+
+        self.callback = None
+        self.clock = 0.0
+
+        self.out_condition = threading.Condition()
+        self.out_queue = collections.deque()  # [key, message], key is None for barriers
+        self.out_slots = {}  # key -> queued entry, for coalescing
+        self.writer = None
+        self.writing = False
+        self.sending = False  # the writer took a batch and has not sent all of it yet
+
+        self.written = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.max_backlog = 0
 
     def open_output(self, midi_id):
         if self.dev_out is None:
             try:
-                self.dev_out = rtmidi2.MidiOut()
+                self.dev_out = self.backend.MidiOut()
                 self.dev_out.open_port(midi_id)
             except:
                 return False
+            self.start_writer()
         return True
 
     def close_output(self):
         if self.dev_out is not None:
+            self.stop_writer()
             self.dev_out.close_port()
             self.dev_out = None
 
+    def start_writer(self):
+        self.writing = True
+        self.writer = threading.Thread(target=self.write_loop, name='midi-out', daemon=True)
+        self.writer.start()
+
+    def stop_writer(self, timeout=1.0):
+        """
+        Sends everything still queued, then stops the writer thread
+        """
+        if self.writer is None:
+            return
+        with self.out_condition:
+            self.writing = False
+            self.out_condition.notify_all()
+        self.writer.join(timeout)
+        self.writer = None
+
+    @staticmethod
+    def coalesce_key(message):
+        # LED writes: note on channel 1 and the control changes of the round buttons
+        if len(message) == 3 and (message[0] == 144 or message[0] == 176 and message[1] >= 104):
+            return message[0], message[1]
+        return None
+
+    def enqueue(self, message):
+        if self.writer is None:
+            # no writer running, e.g. while opening
+            self.dev_out.send_message(message)
+            return
+
+        key = self.coalesce_key(message)
+        with self.out_condition:
+            entry = self.out_slots.get(key) if key is not None else None
+            if entry is not None:
+                entry[1] = message
+                self.coalesced += 1
+                return
+
+            entry = [key, message]
+            self.out_queue.append(entry)
+            if key is None:
+                # later LED writes must not move in front of this message
+                self.out_slots.clear()
+            else:
+                self.out_slots[key] = entry
+
+            self.max_backlog = max(self.max_backlog, len(self.out_queue))
+            self.out_condition.notify()
+
+    def write_loop(self):
+        while True:
+            with self.out_condition:
+                while self.writing and not self.out_queue:
+                    self.out_condition.wait()
+                if not self.out_queue:
+                    break
+
+                batch = [entry[1] for entry in self.out_queue]
+                self.out_queue.clear()
+                self.out_slots.clear()
+                self.sending = True
+
+            started = tracing.tracer.begin()
+            try:
+                self.send_messages(batch)
+            except Exception:
+                log.exception('Unable to write %d MIDI messages', len(batch))
+            tracing.tracer.end('midi write', 'midi', started, {'messages': len(batch)})
+
+            with self.out_condition:
+                self.sending = False
+                self.written += len(batch)
+                self.batches += 1
+                self.out_condition.notify_all()
+
+    def send_messages(self, messages):
+        """
+        Sends <messages> in order. Runs of three byte messages with the same status byte,
+        like the note ons of a frame update, go out as a single send_messages() call
+        where the backend has one (rtmidi2).
+        """
+        send_many = getattr(self.dev_out, 'send_messages', None)
+        start = 0
+        while start < len(messages):
+            status = messages[start][0]
+            end = start + 1
+            if len(messages[start]) == 3 and 0x80 <= status < 0xf0:
+                while end < len(messages) and len(messages[end]) == 3 and messages[end][0] == status:
+                    end += 1
+
+            if end - start > 1 and send_many is not None:
+                # rtmidi2: send_messages(messagetype, [(channel, value1, value2), ...])
+                send_many(status & 0xf0, [(status & 0x0f, message[1], message[2])
+                                          for message in messages[start:end]])
+            else:
+                for message in messages[start:end]:
+                    self.dev_out.send_message(message)
+            start = end
+
+    def drain(self, timeout=1.0):
+        """
+        Waits until all queued messages have been sent to the device, returns False on timeout
+        """
+        with self.out_condition:
+            return self.out_condition.wait_for(lambda: not self.out_queue and not self.sending, timeout)
+
+    def backlog(self):
+        with self.out_condition:
+            return len(self.out_queue)
+
+    def stats(self):
+        with self.out_condition:
+            return {
+                'backlog': len(self.out_queue),
+                'max_backlog': self.max_backlog,
+                'written': self.written,
+                'batches': self.batches,
+                'coalesced': self.coalesced,
+            }
+
     def open_input(self, midi_id):
         if self.dev_in is None:
             try:
-                self.dev_in = rtmidi2.MidiIn()
+                self.dev_in = self.backend.MidiIn()
                 self.dev_in.open_port(midi_id)
             except:
                 return False
@@ -57,9 +214,42 @@ class Midi(object):
 
     def close_input(self):
         if self.dev_in is not None:
+            self.clear_callback()
             self.dev_in.close_port()
             self.dev_in = None
 
+    def set_callback(self, callback):
+        """
+        Switches input to event driven mode.
+        <callback> is called from the driver thread as callback(message, timestamp)
+        for every incoming message, <timestamp> is the driver clock in seconds.
+        Sysex, clock and active sensing messages are dropped by the driver.
+        Returns False if the input is not opened, caller should fall back to polling.
+        """
+        if self.dev_in is None:
+            return False
+
+        self.clock = 0.0
+        self.callback = callback
+        self.dev_in.ignore_types(midi_sysex=True, midi_time=True, midi_sense=True)
+        self.dev_in.callback = self.on_message
+        return True
+
+    def clear_callback(self):
+        """
+        Switches input back to polling mode
+        """
+        if self.dev_in is not None and self.callback is not None:
+            self.dev_in.callback = None
+        self.callback = None
+
+    def on_message(self, message, delta):
+        # rtmidi passes the time since the previous message, keep a running clock
+        self.clock += delta
+        started = tracing.tracer.begin()
+        self.callback(message, self.clock)
+        tracing.tracer.end('midi input', 'midi', started)
+
     def read_raw(self):
         return self.dev_in.get_message()
 
@@ -67,16 +257,20 @@ class Midi(object):
         """
         Sends a single, short message
         """
-        self.dev_out.send_raw(stat, dat1, dat2)
+        self.enqueue([stat, dat1, dat2])
 
     def raw_write_multi(self, messages_list):
         """
-        Sends a list of messages. If timestamp is 0, it is ignored.
+        Sends a list of messages. Timestamps are ignored, the messages are sent in order.
         Amount of <dat> bytes is arbitrary.
         [ [ [stat, <dat1>, <dat2>, <dat3>], timestamp ],  [...], ... ]
+        or [ [stat, <dat1>, <dat2>, <dat3>], [...], ... ]
         <datN> fields are optional
         """
-        self.dev_out.send_message(messages_list)
+        for message in messages_list:
+            if message and isinstance(message[0], (list, tuple)):
+                message = message[0]
+            self.enqueue(list(message))
 
     def raw_write_system_exclusive(self, messages_list):
         """
@@ -85,13 +279,14 @@ class Midi(object):
         [ <dat1>, <dat2>, ..., <datN> ]
         """
 
-        self.dev_out.send_message([0xf0] + messages_list + [0xf7])
+        self.enqueue([0xf0] + messages_list + [0xf7])
 
 
 class LaunchpadBase(object):
+    DECODER = None
 
-    def __init__(self):
-        self.midi = Midi()  # midi interface instance (singleton)
+    def __init__(self, midi=None):
+        self.midi = midi if midi is not None else Midi()  # midi interface instance
         self.id_out = None  # midi id for output
         self.id_in = None  # midi id for input
 
@@ -107,8 +302,8 @@ class LaunchpadBase(object):
         """
         Opens one of the attached Launchpad MIDI devices
         """
-        self.id_out = list(search_output_devices(name))[number]
-        self.id_in = list(search_input_devices(name))[number]
+        self.id_out = list(search_output_devices(name, backend=self.midi.backend))[number]
+        self.id_in = list(search_input_devices(name, backend=self.midi.backend))[number]
 
         if self.id_out is None or self.id_in is None:
             raise ModuleNotFoundError(f'Unable to find launchpad by number {number}')
@@ -123,8 +318,8 @@ class LaunchpadBase(object):
         Checks if a device exists, but does not open it.
         Does not check whether a device is in use or other, strange things...
         """
-        self.id_out = list(search_output_devices(name))[number]
-        self.id_in = list(search_input_devices(name))[number]
+        self.id_out = list(search_output_devices(name, backend=self.midi.backend))[number]
+        self.id_in = list(search_input_devices(name, backend=self.midi.backend))[number]
 
         if self.id_out is None or self.id_in is None:
             return False
@@ -165,11 +360,29 @@ class LaunchpadBase(object):
         else:
             return []
 
+    @property
+    def decoder(self):
+        """
+        Lookup table decoder for this device model, see lp.decoder
+        """
+        return get_decoder(self.DECODER)
+
+    def event_decoded(self, event=None):
+        """
+        Reads a single message and decodes it into <event> (a new KeyEvent if omitted).
+        Returns None if nothing happened or the message is not a button/controller.
+        """
+        msg = self.midi.read_raw()
+        if msg:
+            return self.decoder.decode(msg, 0.0, event)
+        return None
+
 
 class Launchpad(LaunchpadBase):
     """
     For 2-color Launchpads with 8x8 matrix and 2x8 top/right rows
     """
+    DECODER = 'launchpad'
 
     # LED AND BUTTON NUMBERS IN RAW MODE (DEC):
     #
@@ -221,6 +434,181 @@ class Launchpad(LaunchpadBase):
     # |   |   |   |   |   |   |   |   |  |8/8|  8
     # +---+---+---+---+---+---+---+---+  +---+
     #
+    #
+    # FRAMEBUFFER CELLS, SAME ORDER AS led_ctrl_raw_rapid()
+    #
+    #   0..63  8x8 matrix, left to right, top to bottom
+    #  64..71  right column, top to bottom
+    #  72..79  automap row, left to right
+    #
+
+    FRAME_SIZE = 80
+    # a rapid update always sends the whole frame in FRAME_SIZE / 2 messages
+    RAPID_COST = FRAME_SIZE // 2
+
+    # flag bits of the LED velocity byte (bit 3 = clear other buffer, bit 2 = copy to both buffers)
+    LED_BUFFERED = 0  # only write the updating buffer
+    LED_FLASH = 8  # write the updating buffer, clear the other one: flashes in flash mode
+    LED_NORMAL = 12  # write both buffers
+    LED_FLAGS = 12
+
+    def __init__(self, midi=None):
+        super(Launchpad, self).__init__(midi)
+        self.frame_lock = threading.Lock()
+        self.frame = [self.LED_NORMAL] * self.FRAME_SIZE  # what should be shown
+        self.shown = [None] * self.FRAME_SIZE  # what the device shows, None = unknown
+        self.overlay = {}  # cells drawn on top of the frame, e.g. by an animation
+        self.overlaid = set()  # cells the device shows an overlay color on
+
+        self.display_buffer = 0
+        self.update_buffer = 0
+        self.flash_mode = False
+
+    @staticmethod
+    def frame_index(x, y):
+        """
+        Returns the framebuffer cell of button <x>, <y> (y = -1 is the automap row)
+        """
+        if y == -1:
+            return 72 + x
+        if x == 8:
+            return 64 + y
+        return (y << 3) | x
+
+    def frame_set(self, x, y, red, green, flash=False):
+        """
+        Sets LED <x>, <y> in the framebuffer, nothing is sent until flush()
+        If <flash> is set, the LED blinks using the device's own flash timer.
+        """
+        if x < 0 or x > 8 or y < -1 or y > 7 or (y == -1 and x > 7):
+            return
+        flags = self.LED_FLASH if flash else self.LED_NORMAL
+        self.frame[self.frame_index(x, y)] = self.led_get_color(red, green, flags)
+
+    def frame_get(self, x, y):
+        """
+        Returns the color code of LED <x>, <y> in the framebuffer
+        """
+        return self.frame[self.frame_index(x, y)]
+
+    def frame_fill(self, red=0, green=0):
+        """
+        Sets all LEDs in the framebuffer to the same color
+        """
+        self.frame = [self.led_get_color(red, green)] * self.FRAME_SIZE
+
+    def frame_overlay(self, cells):
+        """
+        Replaces the overlay with <cells>, a dict {(x, y): (red, green)}.
+        Overlay cells hide the framebuffer without changing it, an empty dict shows the frame again.
+        """
+        overlay = {}
+        for (x, y), (red, green) in cells.items():
+            if 0 <= x <= 8 and 0 <= y <= 7 or y == -1 and 0 <= x <= 7:
+                overlay[self.frame_index(x, y)] = self.led_get_color(red, green)
+        self.overlay = overlay
+
+    def flush(self, swap=False, limit=None):
+        """
+        Sends the framebuffer cells that differ from what the device shows.
+        If more cells changed than a rapid update costs, the whole frame is sent with
+        led_ctrl_raw_rapid() instead. Returns the amount of messages sent.
+        With <swap> the frame is drawn into the hidden buffer and shown at once, see flush_swap().
+        <limit> caps the messages sent for overlay cells, the remaining ones are sent by later flushes.
+        Changes of the frame itself are always sent.
+        """
+        with self.frame_lock:
+            overlay = self.overlay
+            frame = list(self.frame)
+            for index, led in overlay.items():
+                frame[index] = led
+            changed = [index for index in range(self.FRAME_SIZE) if frame[index] != self.shown[index]]
+            if not changed:
+                return 0
+            if limit is not None and len(changed) > limit and limit <= self.RAPID_COST:
+                # overlay cells and cells going back from the overlay to the frame wait for later flushes
+                animated = [index for index in changed if index in overlay or index in self.overlaid]
+                if len(animated) > limit:
+                    held = set(animated[limit:])
+                    changed = [index for index in changed if index not in held]
+                    swap = False
+
+            if overlay or self.overlaid:
+                self.overlaid.difference_update(changed)
+                self.overlaid.update(index for index in changed if index in overlay)
+
+            sent = 0
+            flashing = any(frame[index] & self.LED_FLAGS == self.LED_FLASH for index in changed)
+            if flashing and not self.flash_mode:
+                self.flash_enable()
+                sent += 1
+
+            if swap:
+                return sent + self.flush_swap(frame, changed)
+            return sent + self.flush_cells(frame, changed)
+
+    def flush_cells(self, frame, changed):
+        if len(changed) > self.RAPID_COST:
+            # any other message moves the rapid update back to the first LED,
+            # X-Y layout is the layout this class uses anyway
+            self.midi.raw_write(176, 1, 0)
+            self.led_ctrl_raw_rapid(frame)
+            return self.RAPID_COST + 1
+
+        for index in changed:
+            self.write_cell(index, frame[index])
+        return len(changed)
+
+    def flush_swap(self, frame, changed):
+        """
+        Double buffered update: the changes go into the hidden buffer (a copy of the shown one),
+        then the buffers are swapped with a single message, so there's no half drawn frame.
+        """
+        front = self.display_buffer
+        back = 1 - front
+        # buffer_select() sets the flash mode of every message, keep the current one
+        flash = self.flash_mode
+        self.buffer_select(front, back, flash=flash, copy=True)
+
+        buffered = [led & ~self.LED_FLAGS for led in frame]
+        sent = 2 + self.flush_cells(buffered, changed)
+
+        # show the new frame and copy it to the other buffer, so both are the same again
+        self.buffer_select(back, front, flash=flash, copy=True)
+
+        # flashing LEDs have to be written once more, the copy put them into both buffers
+        for index in changed:
+            if frame[index] & self.LED_FLAGS == self.LED_FLASH:
+                self.write_cell(index, frame[index])
+                sent += 1
+        self.shown = frame
+        return sent
+
+    def write_cell(self, index, led):
+        if index >= 72:
+            self.midi.raw_write(176, 104 + index - 72, led)
+        elif index >= 64:
+            self.midi.raw_write(144, ((index - 64) << 4) | 8, led)
+        else:
+            self.midi.raw_write(144, ((index >> 3) << 4) | (index & 7), led)
+        self.shown[index] = led
+
+    def buffer_select(self, display=0, update=0, flash=False, copy=False):
+        """
+        Selects the displayed and the updating buffer (0 or 1).
+        <flash> makes the device flip the displayed buffer on its own timer (flashing LEDs),
+        <copy> copies the new displayed buffer into the new updating buffer.
+        """
+        self.midi.raw_write(176, 0, 32 | (copy << 4) | (flash << 3) | (update << 2) | display)
+        self.display_buffer = display
+        self.update_buffer = update
+        self.flash_mode = flash
+
+    def flash_enable(self, enable=True):
+        """
+        Turns the hardware flashing of LEDs written with LED_FLASH on or off
+        """
+        self.buffer_select(self.display_buffer, self.update_buffer, flash=enable)
 
     def reset(self):
         """
@@ -228,14 +616,20 @@ class Launchpad(LaunchpadBase):
         Turns off all LEDs
         """
         self.midi.raw_write(176, 0, 0)
+        self.shown = [self.LED_NORMAL] * self.FRAME_SIZE
+        self.overlaid = set()
+        self.display_buffer = 0
+        self.update_buffer = 0
+        self.flash_mode = False
 
     @staticmethod
-    def led_get_color(red, green):
+    def led_get_color(red, green, flags=LED_NORMAL):
         """
         Returns a Launchpad compatible "color code byte"
+        <flags> selects the buffers written to, see LED_BUFFERED, LED_FLASH and LED_NORMAL
         NOTE: In here, number is 0..7 (left..right)
         """
-        led = 0
+        led = flags
 
         red = min(int(red), 3)  # make int and limit to <=3
         red = max(red, 0)  # no negative numbers
@@ -264,6 +658,8 @@ class Launchpad(LaunchpadBase):
             # 0-120
             led = self.led_get_color(red, green)
             self.midi.raw_write(144, number, led)
+            if number & 0x0f < 9:
+                self.shown[self.frame_index(number & 0x0f, number >> 4)] = led
 
     def led_ctrl_xy(self, x, y, red, green):
         """
@@ -299,6 +695,10 @@ class Launchpad(LaunchpadBase):
         for i in range(0, le, 2):
             self.midi.raw_write(146, all_leds[i], all_leds[i + 1] if i + 1 < le else 0)
 
+        # assumes the update started at the first LED
+        for i in range(min(le + le % 2, self.FRAME_SIZE)):
+            self.shown[i] = all_leds[i] if i < le else self.LED_NORMAL
+
     def led_ctrl_automap(self, number, red, green):
         """
         Controls an automap LED <number>; with <green/red> brightness: 0..3
@@ -312,6 +712,7 @@ class Launchpad(LaunchpadBase):
         led = self.led_get_color(red, green)
 
         self.midi.raw_write(176, 104 + number, led)
+        self.shown[72 + number] = led
 
     def led_all_on(self, color_code=None):
         """
@@ -324,6 +725,7 @@ class Launchpad(LaunchpadBase):
             self.reset()
         else:
             self.midi.raw_write(176, 0, 127)
+            self.shown = [None] * self.FRAME_SIZE
 
     def button_state_raw(self):
         """
@@ -332,9 +734,9 @@ class Launchpad(LaunchpadBase):
         :return:
         """
 
-        a = self.midi.read_raw()
-        if a:
-            return [a[0][1] if a[0][0] == 144 else a[0][1] + 96, True if a[0][2] > 0 else False]
+        event = self.event_decoded()
+        if event:
+            return [event.number, event.pressed]
         else:
             return []
 
@@ -343,16 +745,9 @@ class Launchpad(LaunchpadBase):
         Returns an x/y value of the last button change as a list:
         [ <x>, <y>, <True/False> ]
         """
-        raw = self.midi.read_raw()
-        if raw:
-            if raw[0][0] == 144:
-                x = raw[0][1] & 0x0f
-                y = (raw[0][1] & 0xf0) >> 4
-
-                return [x, y + 1, True if raw[0][2] > 0 else False]
-
-            elif raw[0][0] == 176:
-                return [raw[0][1] - 104, 0, True if raw[0][2] > 0 else False]
+        event = self.event_decoded()
+        if event:
+            return [event.x, event.y + 1, event.pressed]
         return []
 
 
@@ -455,8 +850,59 @@ class LaunchpadPro(LaunchpadBase):
     #        +---+---+---+---+---+---+---+---+
     #
 
+    DECODER = 'launchpad_pro'
+
     COLORS = {'black': 0, 'off': 0, 'white': 3, 'red': 5, 'green': 17}
 
+    SYSEX_DEVICE = 16
+
+    # SysEx LED commands
+    SYSEX_LED_CODES = 10  # <led> <code> pairs
+    SYSEX_LED_RGB = 11  # <led> <red> <green> <blue> tuples
+    SYSEX_LED_COLUMN = 12  # <column> <code>
+    SYSEX_LED_ROW = 13  # <row> <code>
+    SYSEX_LED_ALL = 14  # <code>
+
+    # LEDs the device accepts in a single batched message
+    BATCH_CODES = 80
+    BATCH_RGB = 78
+
+    # F0 + header + command + F7
+    SYSEX_OVERHEAD = 8
+
+    # all LED numbers, and the LEDs set by the row and column commands, bottom/left first
+    LEDS = tuple(number for number in range(1, 99) if number % 10 not in (0, 9) or 10 <= number <= 89)
+    ROWS = (tuple(range(1, 9)),) + tuple(tuple(range(10 * row, 10 * row + 10)) for row in range(1, 9)) + \
+        (tuple(range(91, 99)),)
+    COLUMNS = (tuple(range(10, 90, 10)),) + tuple(tuple(range(column, 100, 10)) for column in range(1, 9)) + \
+        (tuple(range(19, 90, 10)),)
+
+    # RGB colors are written exactly (SysEx) or, if asked for, as the nearest palette code (note on)
+    COLOR_APPROXIMATE = 'approximate'
+    COLOR_EXACT = 'exact'
+
+    def __init__(self, midi=None, color_mode=COLOR_EXACT):
+        super(LaunchpadPro, self).__init__(midi)
+        self.color_mode = color_mode
+
+    @property
+    def sysex_header(self):
+        return [0, 32, 41, 2, self.SYSEX_DEVICE]
+
+    @staticmethod
+    def led_get_color_by_rgb(red, green, blue):
+        """
+        Returns the palette code closest to <red>, <green>, <blue> (0..63 each).
+        Used to write RGB colors as short note on messages.
+        """
+        return import_backend('lp.palette').rgb_to_code(red, green, blue)
+
+    def led_write_rgb(self, number, red, green, blue):
+        if self.color_mode == self.COLOR_EXACT:
+            self.midi.raw_write_system_exclusive(self.sysex_header + [self.SYSEX_LED_RGB, number, red, green, blue])
+        else:
+            self.led_ctrl_raw_by_code(number, self.led_get_color_by_rgb(red, green, blue))
+
     def open(self, number=0, name="Pro"):
         """
         Opens one of the attached Launchpad MIDI devices.
@@ -492,7 +938,8 @@ class LaunchpadPro(LaunchpadBase):
         if mode < 0 or mode > 0x0d:
             return
 
-        self.midi.raw_write_system_exclusive([0, 32, 41, 2, 16, 34, mode])
+        self.midi.raw_write_system_exclusive(self.sysex_header + [34, mode])
+        self.midi.drain()
         time.sleep(0.001 * 10)
 
     def led_set_mode(self, mode):
@@ -505,7 +952,8 @@ class LaunchpadPro(LaunchpadBase):
         if mode < 0 or mode > 1:
             return
 
-        self.midi.raw_write_system_exclusive([0, 32, 41, 2, 16, 33, mode])
+        self.midi.raw_write_system_exclusive(self.sysex_header + [33, mode])
+        self.midi.drain()
         time.sleep(0.001 * 10)
 
     def led_set_button_layout_session(self):
@@ -534,6 +982,7 @@ class LaunchpadPro(LaunchpadBase):
         to emulate the old brightness feeling :)
         Notice that each message requires 10 bytes to be sent. For a faster, but
         unfortunately "not-RGB" method, see "LedCtrlRawByCode()"
+        With color_mode COLOR_APPROXIMATE, the nearest palette color is sent that way instead.
         """
 
         if number < 0 or number > 99:
@@ -550,7 +999,7 @@ class LaunchpadPro(LaunchpadBase):
         green = limit(green, 0, 63)
         blue = limit(blue, 0, 63)
 
-        self.midi.raw_write_system_exclusive([0, 32, 41, 2, 16, 11, number, red, green, blue])
+        self.led_write_rgb(number, red, green, blue)
 
     def led_ctrl_raw_by_code(self, number, color_code=None):
         """
@@ -570,6 +1019,97 @@ class LaunchpadPro(LaunchpadBase):
 
         self.midi.raw_write(144, number, color_code)
 
+    def led_ctrl_raw_batch(self, leds):
+        """
+        Sets many LEDs with as few RGB SysEx messages as possible.
+        <leds> is a list of (<number>, <red>, <green>, <blue>) tuples, intensities 0..63.
+        Returns the amount of messages sent.
+        """
+        limit = lambda n: max(min(63, n), 0)
+
+        data = []
+        for number, red, green, blue in leds:
+            data.extend((number, limit(red), limit(green), limit(blue)))
+
+        size = self.BATCH_RGB * 4
+        for start in range(0, len(data), size):
+            self.midi.raw_write_system_exclusive(self.sysex_header + [self.SYSEX_LED_RGB] + data[start:start + size])
+        return (len(data) + size - 1) // size
+
+    def led_ctrl_raw_by_code_batch(self, leds):
+        """
+        Sets many LEDs to palette colors, <leds> is a list of (<number>, <colorcode>) pairs.
+        A few LEDs are cheaper as single short messages, more go into batched SysEx messages.
+        Returns the amount of messages sent.
+        """
+        leds = list(leds)
+        if len(leds) * 3 <= self.SYSEX_OVERHEAD + len(leds) * 2:
+            for number, code in leds:
+                self.led_ctrl_raw_by_code(number, code)
+            return len(leds)
+
+        data = []
+        for number, code in leds:
+            data.extend((number, max(min(127, code), 0)))
+
+        size = self.BATCH_CODES * 2
+        for start in range(0, len(data), size):
+            self.midi.raw_write_system_exclusive(self.sysex_header + [self.SYSEX_LED_CODES] + data[start:start + size])
+        return (len(data) + size - 1) // size
+
+    def led_ctrl_frame(self, leds):
+        """
+        Writes a set of LED changes with the cheapest encoding the device offers.
+        <leds> maps LED numbers to either a palette code or a (<red>, <green>, <blue>) tuple (0..63).
+        Palette colors covering all LEDs use a single "all" message, full rows and columns
+        of one palette color use the row/column messages, the remaining palette colors
+        go out as note on or batched SysEx and RGB colors as batched RGB SysEx.
+        With color_mode COLOR_APPROXIMATE, RGB colors are turned into palette codes first.
+        Returns the amount of messages sent.
+        """
+        if self.color_mode != self.COLOR_EXACT:
+            leds = {number: color if isinstance(color, int) else self.led_get_color_by_rgb(*color)
+                    for number, color in leds.items()}
+        codes = {number: color for number, color in leds.items() if isinstance(color, int)}
+        rgb = [(number, *color) for number, color in leds.items() if not isinstance(color, int)]
+
+        sent = 0
+        if not rgb and len(codes) >= len(self.LEDS) and len(set(codes.values())) == 1:
+            if all(number in codes for number in self.LEDS):
+                self.midi.raw_write_system_exclusive(
+                    self.sysex_header + [self.SYSEX_LED_ALL, next(iter(codes.values()))])
+                return 1
+
+        # a line message costs the same as 5 LEDs in a batch
+        for command, lines in ((self.SYSEX_LED_ROW, self.ROWS), (self.SYSEX_LED_COLUMN, self.COLUMNS)):
+            for index, line in enumerate(lines):
+                if len(line) * 2 <= self.SYSEX_OVERHEAD + 2:
+                    continue
+                colors = set(codes.get(number) for number in line)
+                if len(colors) != 1 or None in colors:
+                    continue
+                self.midi.raw_write_system_exclusive(self.sysex_header + [command, index, colors.pop()])
+                sent += 1
+                for number in line:
+                    del codes[number]
+
+        if codes:
+            sent += self.led_ctrl_raw_by_code_batch(codes.items())
+        if rgb:
+            sent += self.led_ctrl_raw_batch(rgb)
+        return sent
+
+    @staticmethod
+    def led_number_xy(x, y, mode="classic"):
+        """
+        Returns the raw LED number of <x>, <y>, -1 if there is no such LED. See led_ctrl_xy() for <mode>.
+        """
+        if x < 0 or x > 9 or y < 0 or y > 9:
+            return -1
+        if mode != "pro":
+            x = (x + 1) % 10
+        return 90 - (10 * y) + x
+
     def led_ctrl_xy(self, x, y, red, green, blue=None, mode="classic"):
         """
         Controls a grid LED by its coordinates <x>, <y> and <reg>, <green> and <blue>
@@ -646,7 +1186,7 @@ class LaunchpadPro(LaunchpadBase):
             colorcode = min(colorcode, 127)
             colorcode = max(colorcode, 0)
 
-        self.midi.raw_write_system_exclusive([0, 32, 41, 2, 16, 14, colorcode])
+        self.midi.raw_write_system_exclusive(self.sysex_header + [self.SYSEX_LED_ALL, colorcode])
 
     def reset(self):
         """
@@ -666,31 +1206,13 @@ class LaunchpadPro(LaunchpadBase):
         method in the "Classic" Launchpad, which only returned [ <button>, <True/False> ].
         Compatibility would require checking via "== True" and not "is True".
         """
-        a = self.midi.read_raw()
-        if a:
-            # Note:
-            #  Beside "144" (Note On, grid buttons), "208" (Pressure Value, grid buttons) and
-            #  "176" (Control Change, outer buttons), random (broken) SysEx messages
-            #  can appear here:
-            #   ('###', [[[240, 0, 32, 41], 4]])
-            #   ('-->', [])
-            #   ('###', [[[2, 16, 45, 0], 4]])
-            #   ('###', [[[247, 0, 0, 0], 4]])
-            #  ---
-            #   ('###', [[[240, 0, 32, 41], 4]])
-            #   ('-->', [])
-            #  1st one is a SysEx Message (240, 0, 32, 41, 2, 16 ), with command Mode Status (45)
-            #  in "Ableton Mode" (0) [would be 1 for Standalone Mode). "247" is the SysEx termination.
-            #  Additionally, it's interrupted by a read failure.
-            #  The 2nd one is simply cut. Notice that that these are commands usually send TO the
-            #  Launchpad...
-
-            if a[0] is None:
-                return []
-            elif a[0][0] == 144 or a[0][0] == 176:
-                return [a[0][1], a[0][2]]
-            else:
-                return []
+        # Note:
+        #  Beside "144" (Note On, grid buttons), "208" (Pressure Value, grid buttons) and
+        #  "176" (Control Change, outer buttons), random (broken) SysEx messages
+        #  can appear here. The decoder only knows 144/128 and 176, everything else is dropped.
+        event = self.event_decoded()
+        if event:
+            return [event.number, event.value]
         else:
             return []
 
@@ -708,20 +1230,12 @@ class LaunchpadPro(LaunchpadBase):
         :param mode:
         :return:
         """
-        a = self.midi.read_raw()
-        if a:
-
-            if a[0][0] == 144 or a[0][0] == 176:
-
-                if mode.lower() != "pro":
-                    x = (a[0][1] - 1) % 10
-                else:
-                    x = a[0][1] % 10
-                y = (99 - a[0][1]) / 10
-
-                return [x, y, a[0][2]]
-            else:
-                return []
+        event = self.event_decoded()
+        if event:
+            x = event.x
+            if mode.lower() == "pro":
+                x = (x + 1) % 10
+            return [x, event.y, event.value]
         else:
             return []
 
@@ -730,6 +1244,15 @@ class LaunchpadMk2(LaunchpadPro):
     """
     For 3-color "Mk2" Launchpads with 8x8 matrix and 2x8 right/top rows
     """
+    DECODER = 'launchpad_mk2'
+
+    SYSEX_DEVICE = 24
+
+    # 8x8 grid, right column and top row. Row 8 is the top row, column 8 the right column.
+    LEDS = tuple(number for number in range(11, 90) if number % 10 != 0) + tuple(range(104, 112))
+    ROWS = tuple(tuple(range(10 * row + 11, 10 * row + 20)) for row in range(8)) + (tuple(range(104, 112)),)
+    COLUMNS = tuple(tuple(range(column + 11, 90, 10)) + (104 + column,) for column in range(8)) + \
+        (tuple(range(19, 90, 10)),)
 
     # LED AND BUTTON NUMBERS IN RAW MODE (DEC)
     #
@@ -814,7 +1337,7 @@ class LaunchpadMk2(LaunchpadPro):
             colorcode = min(colorcode, 127)
             colorcode = max(colorcode, 0)
 
-        self.midi.raw_write_system_exclusive([0, 32, 41, 2, 24, 14, colorcode])
+        self.midi.raw_write_system_exclusive(self.sysex_header + [self.SYSEX_LED_ALL, colorcode])
 
     def reset(self):
         """
@@ -835,21 +1358,9 @@ class LaunchpadMk2(LaunchpadPro):
         method in the "Classic" Launchpad, which only returned [ <button>, <True/False> ].
         Compatibility would require checking via "== True" and not "is True".
         """
-        a = self.midi.read_raw()
-        if a:
-
-            if a[0][0] == 144 or a[0][0] == 176:
-
-                if a[0][1] >= 104:
-                    x = a[0][1] - 104
-                    y = 0
-                else:
-                    x = (a[0][1] - 1) % 10
-                    y = (99 - a[0][1]) / 10
-
-                return [x, y, a[0][2]]
-            else:
-                return []
+        event = self.event_decoded()
+        if event:
+            return [event.x, event.y, event.value]
         else:
             return []
 
@@ -862,6 +1373,7 @@ class LaunchpadMk2(LaunchpadPro):
         to emulate the old brightness feeling :)
         Notice that each message requires 10 bytes to be sent. For a faster, but
         unfortunately "not-RGB" method, see "LedCtrlRawByCode()"
+        With color_mode COLOR_APPROXIMATE, the nearest palette color is sent that way instead.
         :return:
         """
 
@@ -882,7 +1394,7 @@ class LaunchpadMk2(LaunchpadPro):
         green = limit_str(green, 0, 63)
         blue = limit_str(blue, 0, 63)
 
-        self.midi.raw_write_system_exclusive([0, 32, 41, 2, 16, 11, number, red, green, blue])
+        self.led_write_rgb(number, red, green, blue)
 
     def led_ctrl_raw_by_code(self, number, color_code=None):
         """
@@ -911,6 +1423,17 @@ class LaunchpadMk2(LaunchpadPro):
         else:
             self.midi.raw_write(176, number, color_code)
 
+    @staticmethod
+    def led_number_xy(x, y, **kwargs):
+        """
+        Returns the raw LED number of <x>, <y>, -1 if there is no such LED
+        """
+        if x < 0 or x > 8 or y < 0 or y > 8:
+            return -1
+        if y == 0:
+            return 104 + x
+        return 91 - (10 * y) + x
+
     def led_ctrl_xy(self, x, y, red, green, blue=None, **kwargs):
         """
         Controls a grid LED by its coordinates <x>, <y> and <reg>, <green> and <blue>
@@ -977,6 +1500,7 @@ class LaunchControlXL(LaunchpadBase):
     """
     For 2-color Launch Control XL
     """
+    DECODER = 'launch_control_xl'
 
     # LED, BUTTON AND POTENTIOMETER NUMBERS IN RAW MODE (DEC)
     #
@@ -1187,28 +1711,13 @@ class LaunchControlXL(LaunchpadBase):
         potentiometers/sliders:  <pot.number>, <value>     , 0 ]
         buttons:                 <pot.number>, <True/False>, 0 ]
         """
-        a = self.midi.read_raw()
-        if a:
-
-            # pressed
-            if a[0][0] == 144:
-                return [a[0][1], True, 127]
-            # released
-            elif a[0][0] == 128:
-                return [a[0][1], False, 0]
-            # potentiometers and the four cursor buttons
-            elif a[0][0] == 176:
-                # cursor buttons
-                if 104 <= a[0][1] <= 107:
-                    if a[0][2] > 0:
-                        return [a[0][1], True, a[0][2]]
-                    else:
-                        return [a[0][1], False, 0]
-                # potentiometers
-                else:
-                    return [a[0][1], a[0][2], 0]
-            else:
-                return []
+        event = self.event_decoded()
+        if event:
+            # potentiometers
+            if event.control:
+                return [event.number, event.value, 0]
+            # buttons and the four cursor buttons
+            return [event.number, event.pressed, event.value]
         else:
             return []
 
@@ -1217,6 +1726,7 @@ class LaunchKeyMini(LaunchpadBase):
     """
     For 2-color LaunchKey Keyboards
     """
+    DECODER = 'launchkey_mini'
 
     # LED, BUTTON, KEY AND POTENTIOMETER NUMBERS IN RAW MODE (DEC)
     # NOTICE THAT THE OCTAVE BUTTONS SHIFT THE KEYS UP OR DOWN BY 12.
@@ -1274,34 +1784,13 @@ class LaunchKeyMini(LaunchpadBase):
         Because of the octave settings cover the complete note range, the button and potentiometer
         numbers collide with the note numbers in the lower octaves.
         """
-        a = self.midi.read_raw()
-        if a:
-
-            # pressed key
-            if a[0][0] == 144:
-                return [a[0][1], True, a[0][2]]
-            # released key
-            elif a[0][0] == 128:
-                return [a[0][1], False, 0]
-            # pressed button
-            elif a[0][0] == 153:
-                return [a[0][1], True, a[0][2]]
-            # released button
-            elif a[0][0] == 137:
-                return [a[0][1], False, 0]
-            # potentiometers and the four cursor buttons
-            elif a[0][0] == 176:
-                # cursor, track and scene buttons
-                if 104 <= a[0][1] <= 109:
-                    if a[0][2] > 0:
-                        return [a[0][1], True, 127]
-                    else:
-                        return [a[0][1], False, 0]
-                # potentiometers
-                else:
-                    return [a[0][1], a[0][2], 0]
-            else:
-                return []
+        event = self.event_decoded()
+        if event:
+            # potentiometers
+            if event.control:
+                return [event.number, event.value, 0]
+            # keys, buttons, cursor, track and scene buttons
+            return [event.number, event.pressed, event.value]
         else:
             return []
 
@@ -1317,6 +1806,7 @@ class Dicer(LaunchpadBase):
     """
     For that Dicer thingy...
     """
+    DECODER = 'dicer'
 
     # LED, BUTTON, KEY AND POTENTIOMETER NUMBERS IN RAW MODE (DEC)
     # NOTICE THAT THE OCTAVE BUTTONS SHIFT THE KEYS UP OR DOWN BY 10.
@@ -1385,31 +1875,12 @@ class Dicer(LaunchpadBase):
         make sense here (less brain calculations for you :)
         :return:
         """
-        a = self.midi.read_raw()
-        if a:
-
-            if 154 <= a[0][0] <= 156:
-                but_num = a[0][1]
-                if 60 <= but_num <= 69:
-                    but_num -= 59
-                    but_num += 10 * (a[0][0] - 154)
-                    if a[0][2] == 127:
-                        return [but_num, True, 127]
-                    else:
-                        return [but_num, False, 0]
-                else:
-                    return []
-            elif 157 <= a[0][0] <= 159:
-                but_num = a[0][1]
-                if 60 <= but_num <= 69:
-                    but_num -= 59
-                    but_num += 100 + 10 * (a[0][0] - 157)
-                    if a[0][2] == 127:
-                        return [but_num, True, 127]
-                    else:
-                        return [but_num, False, 0]
-                else:
-                    return []
+        event = self.event_decoded()
+        if event:
+            if event.value == 127:
+                return [event.number, True, 127]
+            else:
+                return [event.number, False, 0]
         else:
             return []
 
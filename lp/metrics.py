@@ -0,0 +1,369 @@
+# Latency of the press to action path, per action type and stage.
+#
+# Every press is timed at these stages, each histogram holds the time from the
+# previous stage the press went through:
+#
+#   arrival     the MIDI driver received the message (rtmidi timestamp)
+#   decoded     the engine decoded the message
+#   dispatched  the button's action is about to be called
+#   started     an executor worker (or the OBS loop) picked the action up
+#   backend     the backend did its part: hotkey sent, sound decoded and queued
+#               in the mixer, first OBS response received
+#   completed   the action returned
+#
+# plus "total", arrival to completed. Presses whose action was dropped (a full
+# queue, an expired OBS action) end in "dropped" instead and have no total.
+# Histograms are log-linear like HdrHistogram: from a microsecond up to an hour
+# no bucket is wider than 1/16 of its values.
+#
+import json
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger('metrics')
+
+STAGES = ('arrival', 'decoded', 'dispatched', 'started', 'backend', 'completed')
+TOTAL = 'total'
+DROPPED = 'dropped'
+OTHER = 'other'
+
+# 2 ** SUB_BUCKET_BITS buckets per power of two for values below, half as many above
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_BUCKETS = SUB_BUCKETS >> 1
+MAX_VALUE = 3600 * 1000000
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# seconds after which the lowest seen offset between the driver and our clock is measured again
+SYNC_WINDOW = 10.0
+
+DEFAULT_HOST = '127.0.0.1'
+
+
+def bucket_index(value):
+    """
+    Returns the bucket of <value> (whole microseconds)
+    """
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (value >> shift) - HALF_BUCKETS
+
+
+def bucket_value(index):
+    """
+    Returns the highest value of bucket <index>
+    """
+    if index < SUB_BUCKETS:
+        return index
+    shift, sub = divmod(index - SUB_BUCKETS, HALF_BUCKETS)
+    return ((sub + HALF_BUCKETS + 1) << (shift + 1)) - 1
+
+
+class Histogram(object):
+    """
+    Counts of microsecond values in log-linear buckets
+    """
+
+    def __init__(self):
+        self.counts = [0] * (bucket_index(MAX_VALUE) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1000000), 0), MAX_VALUE)
+        with self.lock:
+            self.counts[bucket_index(value)] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """
+        Returns the value <percent> of all values are at or below, within the bucket precision
+        """
+        with self.lock:
+            if not self.count:
+                return 0
+            rank = max(1, math.ceil(self.count * percent / 100))
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    return min(bucket_value(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        data = {
+            'count': self.count,
+            'min': self.min or 0,
+            'max': self.max,
+            'mean': round(self.total / self.count, 1) if self.count else 0,
+        }
+        for percent in PERCENTILES:
+            data[f'p{percent:g}'] = self.percentile(percent)
+        return data
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * len(self.counts)
+            self.count = self.total = self.max = 0
+            self.min = None
+
+
+class Press(object):
+    """
+    The stage times of one press and one action, passed along with the action
+    from thread to thread. Stages are marked in order, each one once.
+    """
+    __slots__ = ('metrics', 'action', 'marks', 'forked')
+
+    def __init__(self, metrics, action, marks):
+        self.metrics = metrics
+        self.action = action
+        self.marks = marks
+        self.forked = False
+
+    def reached(self, stage):
+        for name, _ in self.marks:
+            if name == stage:
+                return True
+        return False
+
+    def mark(self, stage):
+        self.marks.append((stage, time.perf_counter()))
+
+    def fork(self, action):
+        """
+        Returns the timing of <action>, one of possibly several actions of this press
+        """
+        self.forked = True
+        return Press(self.metrics, action, self.marks[:])
+
+    def call(self, func, *args, **kwargs):
+        """
+        Marks the start of the action and runs it, for queuing it on an executor
+        """
+        self.mark('started')
+        return func(*args, **kwargs)
+
+    def finish(self):
+        self.mark('completed')
+        self.metrics.record(self)
+
+    def drop(self):
+        """
+        Ends the timing of an action that will never run
+        """
+        self.mark(DROPPED)
+        self.metrics.record(self)
+
+
+class NullPress(object):
+    """
+    Stands in for a Press when metrics are off or an action didn't come from a press
+    """
+    __slots__ = ()
+
+    def reached(self, stage):
+        return False
+
+    def mark(self, stage):
+        pass
+
+    def fork(self, action):
+        return self
+
+    def call(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def finish(self):
+        pass
+
+    def drop(self):
+        pass
+
+
+NULL_PRESS = NullPress()
+
+
+class Metrics(object):
+    """
+    Histograms of every action type and stage.
+    The MIDI thread starts a press with press(), actions called from it pick up
+    their own copy with begin(<action type>). A press no action picked up is
+    recorded as OTHER (profile switches).
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # driver clock to perf_counter(), see arrival()
+        self.offset = None
+        self.window_offset = None
+        self.window_started = 0.0
+
+    def arrival(self, timestamp, received):
+        """
+        Returns the perf_counter() time the driver received a message at <timestamp> (driver clock).
+        The smallest difference between both clocks seen is the one with the least delay
+        between the driver and the callback. It's measured again every SYNC_WINDOW seconds
+        to follow drift between the clocks.
+        """
+        offset = received - timestamp
+        if self.window_offset is None or offset < self.window_offset:
+            self.window_offset = offset
+        if received - self.window_started > SYNC_WINDOW:
+            self.offset = self.window_offset
+            self.window_offset = None
+            self.window_started = received
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+        return timestamp + self.offset
+
+    def press(self, timestamp, received):
+        """
+        Starts timing a press which arrived at driver time <timestamp> and reached the
+        engine at <received>, the message has been decoded now.
+        <timestamp> 0 means the driver has no timestamps, arrival is <received> then.
+        """
+        if not self.enabled:
+            return NULL_PRESS
+        arrival = self.arrival(timestamp, received) if timestamp else received
+        press = Press(self, OTHER, [('arrival', arrival), ('decoded', time.perf_counter())])
+        self.local.press = press
+        return press
+
+    def begin(self, action):
+        """
+        Returns the timing of an <action> type called for the current press of this thread
+        """
+        press = getattr(self.local, 'press', None)
+        if press is None:
+            return NULL_PRESS
+        return press.fork(action)
+
+    def done(self, press):
+        """
+        Ends the press started by press(), after its actions were called
+        """
+        self.local.press = None
+        if press is not NULL_PRESS and not press.forked and press.reached('dispatched'):
+            press.finish()
+
+    def histogram(self, action, stage):
+        key = action, stage
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def record(self, press):
+        previous = None
+        for stage, at in press.marks:
+            if previous is not None:
+                self.histogram(press.action, stage).record(at - previous)
+            previous = at
+        if stage != DROPPED:
+            self.histogram(press.action, TOTAL).record(press.marks[-1][1] - press.marks[0][1])
+
+    def snapshot(self):
+        """
+        Returns {action: {stage: histogram summary}}, values in microseconds
+        """
+        with self.lock:
+            histograms = list(self.histograms.items())
+        data = {}
+        order = STAGES + (DROPPED, TOTAL)
+        for (action, stage), histogram in sorted(histograms, key=lambda item: (item[0][0], order.index(item[0][1]))):
+            data.setdefault(action, {})[stage] = histogram.snapshot()
+        return data
+
+    def reset(self):
+        with self.lock:
+            histograms = list(self.histograms.values())
+        for histogram in histograms:
+            histogram.reset()
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_text(self):
+        """
+        Returns the snapshot in the Prometheus text format, in seconds
+        """
+        lines = [
+            '# HELP launchpad_latency_seconds Time spent per action type and stage of a press',
+            '# TYPE launchpad_latency_seconds summary',
+        ]
+        for action, stages in self.snapshot().items():
+            for stage, data in stages.items():
+                labels = f'action="{action}",stage="{stage}"'
+                for percent in PERCENTILES:
+                    lines.append(f'launchpad_latency_seconds{{{labels},quantile="{percent / 100:g}"}} '
+                                 f'{data[f"p{percent:g}"] / 1000000:.6f}')
+                lines.append(f'launchpad_latency_seconds_sum{{{labels}}} '
+                             f'{data["mean"] * data["count"] / 1000000:.6f}')
+                lines.append(f'launchpad_latency_seconds_count{{{labels}}} {data["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = self.server.metrics
+        if self.path == '/metrics':
+            self.reply(metrics.to_text(), 'text/plain; version=0.0.4')
+        elif self.path == '/metrics.json':
+            self.reply(metrics.to_json(), 'application/json')
+        else:
+            self.send_error(404)
+
+    def reply(self, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class MetricsServer(object):
+    """
+    Serves the snapshot of <metrics> on http://<host>:<port>/metrics (text) and /metrics.json
+    """
+
+    def __init__(self, metrics, port, host=DEFAULT_HOST):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = metrics
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+        log.info('Serving metrics on port %d', self.port)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,38 +1,570 @@
+import asyncio
+import base64
+import collections
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
 import time
 
-import pyobs
-import pyobs.requests as req
+import websockets
 
-from lp import requests
+from lp import tracing
+from lp.executor import PRIORITY_HIGH, PRIORITY_NORMAL
+
+log = logging.getLogger('obs')
+
+DEFAULT_TIMEOUT = 5
+CONNECT_TIMEOUT = 10
+TRANSFORM_INTERVAL = 1 / 60
+
+BACKOFF_MIN = 0.5
+BACKOFF_MAX = 30
+HEARTBEAT_INTERVAL = 5
+QUEUE_SIZE = 32
+# actions running on the OBS loop at the same time and waiting for one of them to finish
+MAX_RUNNING = 8
+MAX_WAITING = 32
+
+# timing (lp.metrics.Press) of the action a request is sent for, the first response marks its backend stage
+current_press = contextvars.ContextVar('press', default=None)
+
+
+class OBSError(Exception):
+    pass
+
+
+# connection errors worth only an info line, anything else is logged with its traceback
+CONNECT_ERRORS = (OSError, OBSError, asyncio.TimeoutError, websockets.WebSocketException)
+
+
+class OBSClient(object):
+    """
+    Asynchronous obs-websocket client.
+    Requests are sent without waiting for earlier ones, responses are matched by message-id,
+    so any amount of requests can be in flight at the same time.
+    """
+
+    def __init__(self, host, port, password=None):
+        self.host = host
+        self.port = port
+        self.password = password
+
+        self.websocket = None
+        self.reader = None
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.handlers = {}
+
+    async def connect(self):
+        self.websocket = await websockets.connect(f'ws://{self.host}:{self.port}', max_size=None)
+        self.reader = asyncio.ensure_future(self.read())
+
+        auth = await self.call('GetAuthRequired')
+        if auth.get('authRequired'):
+            if not self.password:
+                raise OBSError('OBS requires a password')
+            secret = self.hash(self.password + auth['salt'])
+            await self.call('Authenticate', auth=self.hash(secret + auth['challenge']))
+
+    @staticmethod
+    def hash(value):
+        return base64.b64encode(hashlib.sha256(value.encode('utf-8')).digest()).decode('utf-8')
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.websocket is not None:
+            await self.websocket.close()
+            self.websocket = None
+        self.fail_pending(OBSError('Connection closed'))
+
+    def fail_pending(self, error):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    async def call(self, request, timeout=DEFAULT_TIMEOUT, **fields):
+        """
+        Sends <request> with <fields> and waits for its response.
+        Raises OBSError if OBS reports an error and asyncio.TimeoutError after <timeout> seconds.
+        """
+        if self.websocket is None:
+            raise OBSError('Not connected')
+
+        message_id = str(next(self.ids))
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        started = tracing.tracer.begin()
+        try:
+            await self.websocket.send(json.dumps({'request-type': request, 'message-id': message_id, **fields}))
+            response = await asyncio.wait_for(future, timeout)
+        finally:
+            # timed out or cancelled requests are forgotten, a late response is ignored
+            self.pending.pop(message_id, None)
+            tracing.tracer.end_async(request, 'obs', started)
+
+        press = current_press.get()
+        if press is not None and not press.reached('backend'):
+            press.mark('backend')
+
+        if response.get('status') == 'error':
+            raise OBSError(f'{request}: {response.get("error")}')
+        return response
+
+    def on(self, event, handler):
+        """
+        Calls handler(data) for every <event> (update-type) OBS sends
+        """
+        self.handlers.setdefault(event, []).append(handler)
+
+    async def read(self):
+        try:
+            async for message in self.websocket:
+                data = json.loads(message)
+                message_id = data.get('message-id')
+                if message_id is not None:
+                    future = self.pending.get(message_id)
+                    if future is not None and not future.done():
+                        future.set_result(data)
+                    continue
+
+                for handler in self.handlers.get(data.get('update-type'), ()):
+                    try:
+                        handler(data)
+                    except Exception:
+                        log.exception('OBS event handler failed')
+        except websockets.ConnectionClosed:
+            log.info('OBS connection closed')
+        finally:
+            self.fail_pending(OBSError('Connection closed'))
+
+
+class OBSState(object):
+    """
+    Local mirror of the current scene, the scene list, the items of every scene and their transforms.
+    Loaded when connecting and kept current from OBS events, so actions don't have to ask OBS.
+    Item transforms are fetched the first time they are needed.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+        self.current_scene = None
+        self.scenes = {}
+        self.transforms = {}
+        # transforms with local changes not confirmed by OBS yet, events for them are stale
+        self.locked = set()
+
+        client.on('SwitchScenes', self.switch_scenes)
+        client.on('ScenesChanged', self.scenes_changed)
+        client.on('SceneItemAdded', self.item_added)
+        client.on('SceneItemRemoved', self.item_removed)
+        client.on('SceneItemVisibilityChanged', self.item_visibility_changed)
+        client.on('SceneItemTransformChanged', self.item_transform_changed)
+        client.on('SourceRenamed', self.source_renamed)
+
+    async def load(self):
+        scene_list = await self.client.call('GetSceneList')
+        self.current_scene = scene_list['current-scene']
+        self.scenes = {
+            scene['name']: self.scene_items(scene.get('sources', []))
+            for scene in scene_list['scenes']
+        }
+        self.transforms = {}
+        log.info('Loaded %d OBS scenes, current scene is %s', len(self.scenes), self.current_scene)
+
+    @staticmethod
+    def scene_items(sources):
+        return {source['name']: {'visible': source.get('render', True)} for source in sources}
+
+    @staticmethod
+    def transform(data):
+        return {
+            'scale_x': data['scale']['x'],
+            'scale_y': data['scale']['y'],
+            'position_x': data.get('position', {}).get('x'),
+            'position_y': data.get('position', {}).get('y'),
+        }
+
+    async def item_transform(self, scene, item):
+        """
+        Returns the cached transform of <item> in <scene>, fetching it once if it's not known yet
+        """
+        transform = self.transforms.get((scene, item))
+        if transform is None:
+            data = await self.client.call('GetSceneItemProperties', item=item, **{'scene-name': scene})
+            transform = self.transforms.setdefault((scene, item), self.transform(data))
+        return transform
+
+    def switch_scenes(self, data):
+        self.current_scene = data['scene-name']
+        if 'sources' in data:
+            self.scenes[self.current_scene] = self.scene_items(data['sources'])
+
+    def scenes_changed(self, data):
+        if 'scenes' in data:
+            names = {scene['name'] for scene in data['scenes']}
+            self.scenes = {
+                scene['name']: self.scene_items(scene.get('sources', []))
+                for scene in data['scenes']
+            }
+            self.transforms = {key: value for key, value in self.transforms.items() if key[0] in names}
+        else:
+            # older obs-websocket versions don't send the list with the event
+            asyncio.ensure_future(self.load())
+
+    def item_added(self, data):
+        self.scenes.setdefault(data['scene-name'], {})[data['item-name']] = {'visible': True}
+
+    def item_removed(self, data):
+        self.scenes.get(data['scene-name'], {}).pop(data['item-name'], None)
+        self.transforms.pop((data['scene-name'], data['item-name']), None)
+
+    def item_visibility_changed(self, data):
+        self.scenes.setdefault(data['scene-name'], {})[data['item-name']] = {'visible': data['item-visible']}
+
+    def item_transform_changed(self, data):
+        key = data['scene-name'], data['item-name']
+        if key not in self.locked:
+            self.transforms[key] = self.transform(data['transform'])
+
+    def source_renamed(self, data):
+        old, new = data['previousName'], data['newName']
+        if old in self.scenes:
+            self.scenes[new] = self.scenes.pop(old)
+        if self.current_scene == old:
+            self.current_scene = new
+        for items in self.scenes.values():
+            if old in items:
+                items[new] = items.pop(old)
+        self.transforms = {
+            (new if scene == old else scene, new if item == old else item): transform
+            for (scene, item), transform in self.transforms.items()
+        }
+
+
+class TransformManager(object):
+    """
+    Applies transform changes to the local state right away and sends them to OBS
+    at most once per item every <interval> seconds, so a burst of presses becomes
+    a single SetSceneItemProperties with the combined result.
+    """
+
+    def __init__(self, client, state, interval=TRANSFORM_INTERVAL):
+        self.client = client
+        self.state = state
+        self.interval = interval
+
+        self.dirty = {}
+        # number of the latest write of every item in flight, only that one unlocks the item
+        self.writes = {}
+        self.flusher = None
+        self.last_flush = 0.0
+
+        self.changes = 0
+        self.sent = 0
+
+    async def scale(self, scene, item, factor_x, factor_y):
+        transform = await self.state.item_transform(scene, item)
+        transform['scale_x'] *= factor_x
+        transform['scale_y'] *= factor_y
+        self.changed(scene, item, transform)
+
+    def changed(self, scene, item, transform):
+        key = scene, item
+        self.state.locked.add(key)
+        self.dirty[key] = transform
+        self.changes += 1
+        if self.flusher is None:
+            self.flusher = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        loop = asyncio.get_running_loop()
+        delay = self.last_flush + self.interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        self.flusher = None
+        self.last_flush = loop.time()
+        dirty, self.dirty = self.dirty, {}
+        writes = []
+        for key, transform in dirty.items():
+            self.writes[key] = self.writes.get(key, 0) + 1
+            writes.append(self.send(key, transform, self.writes[key]))
+        await asyncio.gather(*writes)
+
+    async def send(self, key, transform, number):
+        scene, item = key
+        try:
+            self.sent += 1
+            await self.client.call(
+                'SetSceneItemProperties', item=item,
+                scale={'x': transform['scale_x'], 'y': transform['scale_y']}, **{'scene-name': scene})
+        except Exception as exc:
+            log.warning('Unable to update %s in %s: %s', item, scene, exc)
+        finally:
+            if self.writes.get(key) == number and key not in self.dirty:
+                del self.writes[key]
+                self.state.locked.discard(key)
 
 
 class OBS(object):
-    def __init__(self, config):
+    """
+    Runs the OBS client on its own event loop thread.
+    Actions are coroutines, run() schedules them without blocking the caller.
+
+    At most <max_running> actions run at the same time, others wait by priority (scene
+    switches first), then in order. Actions are dropped while <max_waiting> are waiting.
+
+    A supervisor keeps the connection alive: it reconnects with exponential backoff and jitter,
+    checks liveness with a heartbeat request and replays actions pressed during an outage,
+    unless they are older than their ACTION_TTL.
+    <on_status> is called as on_status(connected) from the OBS thread whenever the connection state changes.
+    """
+    ACTIONS = ('toggle_mute', 'switch_scene', 'show_and_hide_scene_item', 'scale')
+
+    # seconds an action pressed while disconnected is still worth running
+    ACTION_TTL = {
+        'toggle_mute': 5,
+        'switch_scene': 2,
+        'show_and_hide_scene_item': 2,
+        'scale': 10,
+    }
+
+    PRIORITIES = {
+        'switch_scene': PRIORITY_HIGH,
+    }
+
+    def __init__(self, config, on_status=None):
         self.host = config.obs.url
         self.port = config.obs.port
         self.password = config.obs.get('password')
 
-        self.client = pyobs.Client(self.host, self.port, self.password)
-        self.client.connect()
+        self.backoff_min = config.obs.get('backoff_min', BACKOFF_MIN)
+        self.backoff_max = config.obs.get('backoff_max', BACKOFF_MAX)
+        self.heartbeat = config.obs.get('heartbeat', HEARTBEAT_INTERVAL)
+
+        self.connected = False
+        self.on_status = on_status
+        self.reported = None
+        self.running = True
+        self.queued = collections.deque(maxlen=config.obs.get('queue_size', QUEUE_SIZE))
+        self.reconnects = 0
+        self.expired = 0
+
+        self.max_running = config.obs.get('max_running', MAX_RUNNING)
+        self.max_waiting = config.obs.get('max_waiting', MAX_WAITING)
+        self.running_actions = 0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.dropped = 0
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='obs', daemon=True)
+        self.thread.start()
+
+        self.client = OBSClient(self.host, self.port, self.password)
+        self.state = OBSState(self.client)
+        self.transforms = TransformManager(
+            self.client, self.state, config.obs.get('transform_interval', TRANSFORM_INTERVAL))
+
+        self.supervisor = self.submit(self.supervise())
+
+    async def connect(self):
+        await self.client.connect()
+        await self.state.load()
+
+    async def supervise(self):
+        delay = self.backoff_min
+        while self.running:
+            try:
+                await asyncio.wait_for(self.connect(), CONNECT_TIMEOUT)
+            except Exception as exc:
+                # also unexpected ones, like a scene list OBSState can't read: the supervisor must keep going
+                await self.client.close()
+                self.report_status(False)
+                wait = delay * random.uniform(0.5, 1.5)
+                if isinstance(exc, CONNECT_ERRORS):
+                    log.info('Unable to connect to OBS (%s), retrying in %.1fs', exc, wait)
+                else:
+                    log.exception('Unable to connect to OBS, retrying in %.1fs', wait)
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.backoff_max)
+                continue
 
-    def toggle_mute(self, source=None):
-        return self.client.call(req.ToggleMute(source))
+            delay = self.backoff_min
+            self.connected = True
+            log.info('Connected to OBS at %s:%s', self.host, self.port)
+            self.report_status(True)
+            try:
+                self.replay()
+                await self.watch()
+            except Exception:
+                log.exception('OBS connection failed')
 
-    def switch_scene(self, scene=None):
-        return self.client.call(req.SetCurrentScene(scene))
+            self.connected = False
+            self.reconnects += 1
+            await self.client.close()
+            if self.running:
+                log.warning('Lost connection to OBS, reconnecting')
+                self.report_status(False)
 
-    def show_and_hide_scene_item(self, source, timeout, delay=0):
-        current_scene = self.client.call(req.GetCurrentScene()).name
+    def report_status(self, connected):
+        if self.on_status is None or self.reported == connected:
+            return
+        self.reported = connected
+        try:
+            self.on_status(connected)
+        except Exception:
+            log.exception('OBS status callback failed')
+
+    async def watch(self):
+        """
+        Returns when the connection is closed or OBS stops answering the heartbeat
+        """
+        while self.running:
+            done, _ = await asyncio.wait([self.client.reader], timeout=self.heartbeat)
+            if done:
+                return
+            try:
+                await self.client.call('GetVersion', timeout=self.heartbeat)
+            except (OBSError, asyncio.TimeoutError) as exc:
+                log.warning('OBS heartbeat failed: %s', exc)
+                return
+
+    def replay(self):
+        now = time.monotonic()
+        while self.queued:
+            expires, request, kwargs, press = self.queued.popleft()
+            if expires < now:
+                self.expired += 1
+                log.info('Dropping OBS action %s pressed while disconnected', request)
+                if press is not None:
+                    press.drop()
+                continue
+            self.schedule(request, kwargs, press)
+
+    def schedule(self, request, kwargs, press=None):
+        if self.running_actions < self.max_running:
+            return self.start(request, kwargs, press)
+        if len(self.waiting) >= self.max_waiting:
+            self.dropped += 1
+            log.warning('Too many OBS actions waiting, %s dropped', request)
+            if press is not None:
+                press.drop()
+            return
+        priority = self.PRIORITIES.get(request, PRIORITY_NORMAL)
+        heapq.heappush(self.waiting, (priority, next(self.counter), request, kwargs, press))
+
+    def start(self, request, kwargs, press):
+        self.running_actions += 1
+        task = asyncio.ensure_future(self.timed(request, kwargs, press))
+        task.add_done_callback(lambda item: self.finished(request, item))
+
+    def finished(self, request, future):
+        self.running_actions -= 1
+        self.log_result(request, future)
+        if self.waiting and self.running_actions < self.max_running:
+            _, _, request, kwargs, press = heapq.heappop(self.waiting)
+            self.start(request, kwargs, press)
+
+    async def timed(self, request, kwargs, press):
+        if press is None:
+            return await getattr(self, request)(**kwargs)
+        current_press.set(press)
+        press.mark('started')
+        try:
+            return await getattr(self, request)(**kwargs)
+        finally:
+            press.finish()
+
+    async def perform(self, request, kwargs, pressed, press=None):
+        if self.connected:
+            return self.schedule(request, kwargs, press)
+
+        if len(self.queued) == self.queued.maxlen:
+            log.warning('OBS action queue is full, dropping the oldest action')
+            oldest = self.queued.popleft()[3]
+            if oldest is not None:
+                oldest.drop()
+        self.queued.append((pressed + self.ACTION_TTL.get(request, 5), request, kwargs, press))
+
+    def submit(self, coroutine):
+        """
+        Schedules <coroutine> on the OBS loop, returns a concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, request, press=None, **kwargs):
+        """
+        Schedules action <request> with <kwargs>, errors are logged.
+        While OBS is disconnected the action is queued until the connection is back.
+        <press> is the timing of the press the action belongs to, see lp.metrics.
+        """
+        return self.submit(self.perform(request, kwargs, time.monotonic(), press))
+
+    def call_later(self, delay, request, *args):
+        """
+        Runs coroutine <request>(*args) after <delay> seconds without holding a running slot,
+        for the later part of an action
+        """
+        def run():
+            task = asyncio.ensure_future(request(*args))
+            task.add_done_callback(lambda item: self.log_result(request.__name__, item))
+        self.loop.call_later(delay, run)
+
+    @staticmethod
+    def log_result(request, future):
+        if not future.cancelled() and future.exception() is not None:
+            log.warning('OBS action %s failed: %s', request, future.exception())
+
+    def close(self):
+        self.running = False
+        self.supervisor.cancel()
+        try:
+            self.submit(self.client.close()).result(DEFAULT_TIMEOUT)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def stats(self):
+        return {
+            'connected': self.connected,
+            'queued': len(self.queued),
+            'expired': self.expired,
+            'reconnects': self.reconnects,
+            'running': self.running_actions,
+            'waiting': len(self.waiting),
+            'dropped': self.dropped,
+        }
+
+    async def toggle_mute(self, source=None):
+        return await self.client.call('ToggleMute', source=source)
+
+    async def switch_scene(self, scene=None):
+        return await self.client.call('SetCurrentScene', **{'scene-name': scene})
+
+    async def show_and_hide_scene_item(self, source, timeout, delay=0):
+        # the waits don't hold a running slot, long show/hide presses would block every other action
+        current_scene = self.state.current_scene
         if delay:
-            time.sleep(delay)
-        self.client.call(req.SetSceneItemProperties(source, visible=True, scene_name=current_scene))
-        time.sleep(timeout)
-        self.client.call(req.SetSceneItemProperties(source, visible=False, scene_name=current_scene))
-
-    def scale(self, source, percent_x, percent_y):
-        current_scene = self.client.call(req.GetCurrentScene()).name
-        current_item = self.client.call(req.GetSceneItemProperties(source))
-        scale_x = current_item._returns['scale']['x'] * (1 + (percent_x / 100))
-        scale_y = current_item._returns['scale']['y'] * (1 + (percent_y / 100))
-        self.client.call(requests.SetSceneItemProperties(
-            source, scale_x=scale_x, scale_y=scale_y, scene_name=current_scene))
+            self.call_later(delay, self.show_scene_item, current_scene, source, timeout)
+        else:
+            await self.show_scene_item(current_scene, source, timeout)
+
+    async def show_scene_item(self, scene, source, timeout):
+        await self.set_item_visible(scene, source, True)
+        self.call_later(timeout, self.set_item_visible, scene, source, False)
+
+    async def set_item_visible(self, scene, source, visible):
+        return await self.client.call('SetSceneItemProperties', item=source, visible=visible, **{'scene-name': scene})
+
+    async def scale(self, source, percent_x, percent_y):
+        await self.transforms.scale(
+            self.state.current_scene, source, 1 + (percent_x / 100), 1 + (percent_y / 100))
@@ -0,0 +1,115 @@
+# RGB to palette code lookup for the Launchpad Pro and Mk2.
+#
+# Palette colors are written with a 3 byte note on message, RGB colors need a
+# 10 byte SysEx message. The lookup table maps every 6 bit RGB color (64x64x64)
+# to the nearest of the 128 palette entries, so RGB colors can be written as
+# note on messages too. Building it takes a moment, so it is kept on disk.
+#
+import hashlib
+import logging
+import os
+import threading
+
+import numpy
+
+from settings import CACHE_FOLDER
+
+log = logging.getLogger('palette')
+
+# Launchpad Pro / Mk2 palette, code 0..127, 8 bit RGB
+PALETTE = (
+    0x000000, 0x1c1c1c, 0x7c7c7c, 0xfcfcfc, 0xff4e48, 0xfe0a00, 0x5a0000, 0x180002,
+    0xffbc63, 0xff5700, 0x5a1d00, 0x241802, 0xfdfd21, 0xfdfd00, 0x585800, 0x181800,
+    0x81fd2b, 0x40fd01, 0x165800, 0x132801, 0x35fd2b, 0x00fe00, 0x005801, 0x001800,
+    0x35fc47, 0x00fe00, 0x005801, 0x001800, 0x32fd7f, 0x00fd3a, 0x015814, 0x001c0e,
+    0x2ffcb1, 0x00fb91, 0x015732, 0x01180f, 0x39beff, 0x00a7ff, 0x014051, 0x001018,
+    0x4186ff, 0x0050ff, 0x011a5a, 0x010619, 0x4747ff, 0x0000fe, 0x00005a, 0x000018,
+    0x8347ff, 0x5000ff, 0x160067, 0x0b0032, 0xff48fe, 0xff00fe, 0x5a005a, 0x180018,
+    0xfb4e83, 0xff0753, 0x5a021b, 0x210110, 0xff1901, 0x9a3500, 0x7a5101, 0x3e6500,
+    0x013800, 0x005432, 0x00537f, 0x0000fe, 0x01444d, 0x1a00d1, 0x7c7c7c, 0x202020,
+    0xff0a00, 0xbafd00, 0xaaed01, 0x56fd00, 0x008800, 0x01fc7b, 0x00a7ff, 0x021aff,
+    0x3500ff, 0x7800ff, 0xb4177e, 0x412000, 0xff4a01, 0x82e100, 0x66fd00, 0x00fe00,
+    0x00fe00, 0x45fd61, 0x01fbcb, 0x5086ff, 0x274dc9, 0x827aed, 0xd30cff, 0xff065a,
+    0xff7d01, 0xb8b100, 0x8afd00, 0x815d00, 0x3a2802, 0x0d4c05, 0x005037, 0x131429,
+    0x101f5a, 0x6a3c18, 0xac0401, 0xe15136, 0xdc6900, 0xfee100, 0x99e101, 0x5fb500,
+    0x1b1c31, 0xdcfd54, 0x76fbb9, 0x9698ff, 0x8b62ff, 0x404040, 0x747474, 0xdefcfc,
+    0xa20401, 0x340100, 0x00d201, 0x004101, 0xb8b100, 0x3c3000, 0xb45d00, 0x4c1300,
+)
+
+LEVELS = 64
+
+
+def palette_rgb():
+    """
+    Returns the palette as a 128x3 array of 6 bit intensities (0..63), like the SysEx RGB messages use
+    """
+    colors = numpy.array(PALETTE, dtype=numpy.uint32)
+    rgb = numpy.stack(((colors >> 16) & 0xff, (colors >> 8) & 0xff, colors & 0xff), axis=1)
+    return (rgb >> 2).astype(numpy.int32)
+
+
+def build_table():
+    """
+    Returns the nearest palette code of every 6 bit RGB color, indexed by (red << 12) | (green << 6) | blue
+    """
+    palette = palette_rgb()
+    levels = numpy.arange(LEVELS, dtype=numpy.int32)
+    green, blue = numpy.meshgrid(levels, levels, indexing='ij')
+    green = green.reshape(-1, 1)
+    blue = blue.reshape(-1, 1)
+
+    table = numpy.empty(LEVELS ** 3, dtype=numpy.uint8)
+    plane = LEVELS * LEVELS
+    # one red level at a time keeps the distance matrix at 4096x128
+    for red in range(LEVELS):
+        distance = (red - palette[:, 0]) ** 2 + (green - palette[:, 1]) ** 2 + (blue - palette[:, 2]) ** 2
+        table[red * plane:(red + 1) * plane] = distance.argmin(axis=1)
+    return table
+
+
+def cache_path():
+    # a changed palette gets a new file
+    digest = hashlib.sha256(numpy.array(PALETTE, dtype=numpy.uint32).tobytes()).hexdigest()[:16]
+    return os.path.join(CACHE_FOLDER, f'palette-{digest}.bin')
+
+
+def load_table():
+    """
+    Returns the lookup table from the disk cache, builds and stores it if it is missing or broken
+    """
+    path = cache_path()
+    try:
+        table = numpy.fromfile(path, dtype=numpy.uint8)
+        if len(table) == LEVELS ** 3:
+            return table
+        log.warning('Palette cache %s is broken, building it again', path)
+    except OSError:
+        pass
+
+    table = build_table()
+    try:
+        table.tofile(path)
+    except OSError as exc:
+        log.warning('Unable to store palette cache %s: %s', path, exc)
+    return table
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = load_table()
+    return _table
+
+
+def rgb_to_code(red, green, blue):
+    """
+    Returns the palette code nearest to <red>, <green>, <blue> (0..63 each)
+    """
+    limit = lambda n: max(min(LEVELS - 1, int(n)), 0)
+    return int(get_table()[(limit(red) << 12) | (limit(green) << 6) | limit(blue)])
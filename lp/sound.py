@@ -0,0 +1,221 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from pydub import AudioSegment
+
+from lp import tracing
+
+log = logging.getLogger('sound')
+
+DEFAULT_BUDGET_MB = 256
+
+# Everything is decoded straight into the format the mixer plays
+FRAME_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+
+
+def normalize(segment):
+    """
+    Converts <segment> to the mixer's output format
+    """
+    return segment.set_frame_rate(FRAME_RATE).set_channels(CHANNELS).set_sample_width(SAMPLE_WIDTH)
+
+
+class SoundCache(object):
+    """
+    Keeps decoded sounds in memory, so repeated presses don't spawn ffmpeg again.
+    Entries are keyed by path and modification time, so an edited file gets decoded again.
+    Least recently used entries are evicted when the decoded data exceeds <budget> bytes.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET_MB * 1024 * 1024):
+        self.budget = budget
+        self.size = 0
+
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(path):
+        return os.path.abspath(path), os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def decode(path):
+        return normalize(AudioSegment.from_file(path))
+
+    def get(self, path):
+        """
+        Returns the decoded AudioSegment for <path>, decoding it on a miss
+        """
+        key = self.key(path)
+        with self.lock:
+            segment = self.items.get(key)
+            if segment is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return segment
+            self.misses += 1
+
+        started = tracing.tracer.begin()
+        segment = self.decode(path)
+        tracing.tracer.end('sound decode', 'sound', started, {'path': path})
+        self.put(key, segment)
+        return segment
+
+    def put(self, key, segment):
+        size = len(segment.raw_data)
+        if size > self.budget:
+            log.warning('Sound %s is %d bytes decoded, larger than the whole cache', key[0], size)
+            return
+
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= len(old.raw_data)
+
+            # Older versions of the same file will never be requested again
+            for stale in [item for item in self.items if item[0] == key[0]]:
+                self.size -= len(self.items.pop(stale).raw_data)
+
+            self.items[key] = segment
+            self.size += size
+
+            while self.size > self.budget:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted.raw_data)
+                self.evictions += 1
+
+    def __contains__(self, path):
+        try:
+            key = self.key(path)
+        except OSError:
+            return False
+        with self.lock:
+            return key in self.items
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'items': len(self.items),
+                'size': self.size,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def decode_file(path):
+    """
+    Decodes <path> in a pre-warm worker process.
+    Returns the raw PCM data and its format, AudioSegment is rebuilt in the main process.
+    """
+    segment = normalize(AudioSegment.from_file(path))
+    return segment.raw_data, segment.sample_width, segment.frame_rate, segment.channels
+
+
+class SoundPrewarm(object):
+    """
+    Decodes sounds on a process pool in the background and stores them in <cache>.
+    <callback> is called as callback(path, error) when a sound is done, error is None on success.
+    """
+
+    def __init__(self, cache, workers=None):
+        self.cache = cache
+        self.workers = workers
+        self.executor = None
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.done = 0
+        self.failed = 0
+
+    def prewarm(self, paths, callback=None):
+        """
+        Queues all <paths> which are not cached yet, returns the amount of queued sounds
+        """
+        queued = 0
+        for path in dict.fromkeys(paths):
+            try:
+                key = self.cache.key(path)
+            except OSError as exc:
+                log.warning('Unable to pre-warm %s: %s', path, exc)
+                if callback:
+                    callback(path, exc)
+                continue
+
+            if path in self.cache:
+                if callback:
+                    callback(path, None)
+                continue
+
+            with self.lock:
+                future = self.pending.get(key)
+                if future is None:
+                    if self.executor is None:
+                        # forking a process with MIDI, audio and OBS threads running can deadlock the child
+                        self.executor = ProcessPoolExecutor(self.workers,
+                                                            mp_context=multiprocessing.get_context('spawn'))
+                    future = self.executor.submit(decode_file, path)
+                    self.pending[key] = future
+                    queued += 1
+                elif callback:
+                    # already decoding for an earlier bind, only report the result
+                    future.add_done_callback(lambda item, p=path: item.cancelled() or callback(p, item.exception()))
+                    continue
+                else:
+                    continue
+
+            future.add_done_callback(lambda item, k=key, p=path: self.finished(item, k, p, callback))
+
+        if queued:
+            log.info('Pre-warming %d sounds', queued)
+        return queued
+
+    def finished(self, future, key, path, callback):
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if error is None:
+            data, sample_width, frame_rate, channels = future.result()
+            self.cache.put(key, AudioSegment(
+                data=data, sample_width=sample_width, frame_rate=frame_rate, channels=channels))
+
+        with self.lock:
+            self.pending.pop(key, None)
+            if error is None:
+                self.done += 1
+            else:
+                self.failed += 1
+            remaining = len(self.pending)
+
+        if error is None:
+            log.debug('Pre-warmed %s, %d remaining', path, remaining)
+        else:
+            log.warning('Unable to pre-warm %s: %s', path, error)
+        if callback:
+            callback(path, error)
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self):
+        with self.lock:
+            return {'pending': len(self.pending), 'done': self.done, 'failed': self.failed}
@@ -0,0 +1,86 @@
+# Lazy imports of action backends and the startup report.
+#
+# Keyboard, sound and OBS actions pull in pyautogui, pydub/numpy/PyAudio and
+# websockets. They are only imported once a profile binds an action of that
+# type, and the time each import took is kept for the startup report.
+#
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+
+log = logging.getLogger('startup')
+
+_imports = {}
+_imports_lock = threading.Lock()
+
+
+def import_backend(name):
+    """
+    Imports module <name> on first use and records how long the import took
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    with _imports_lock:
+        started = time.perf_counter()
+        module = importlib.import_module(name)
+        _imports.setdefault(name, time.perf_counter() - started)
+    log.debug('Imported %s in %.1f ms', name, _imports[name] * 1000)
+    return module
+
+
+def import_times():
+    with _imports_lock:
+        return dict(_imports)
+
+
+def memory_usage():
+    """
+    Returns the resident set size of this process in bytes, None where it can't be read
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # peak instead of current, kilobytes on Linux but bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def report(started, imported=None, **extra):
+    """
+    Returns the startup report: seconds since <started> (a perf_counter() value taken before
+    the first import), the time spent importing modules up to <imported>, backend import times,
+    resident memory and amount of loaded modules
+    """
+    now = time.perf_counter()
+    data = {
+        'startup': now - started,
+        'imports': (imported - started) if imported is not None else None,
+        'backends': import_times(),
+        'rss': memory_usage(),
+        'modules': len(sys.modules),
+        'gui': 'wx' in sys.modules,
+    }
+    data.update(extra)
+    return data
+
+
+def format_report(data):
+    text = f"Started in {data['startup'] * 1000:.0f} ms"
+    if data['imports'] is not None:
+        text += f" (imports {data['imports'] * 1000:.0f} ms)"
+    if data['rss'] is not None:
+        text += f", {data['rss'] / 1048576:.1f} MB resident"
+    backends = ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in sorted(data['backends'].items()))
+    return text + f", {data['modules']} modules, backends: {backends or 'none'}"
@@ -0,0 +1,198 @@
+# Opt-in tracing of engine activity in the Chrome trace event format.
+#
+# Spans of MIDI input, dispatch, action workers, sound decoding, OBS requests
+# and LED writes go into a fixed size ring buffer, the oldest are overwritten.
+# dump() writes them as JSON that chrome://tracing, Perfetto (ui.perfetto.dev)
+# or speedscope open, with one track per thread.
+#
+# Tracing is off unless enable() is called, the module level tracer is a
+# NullTracer until then and costs a method call per span:
+#
+#     started = tracing.tracer.begin()
+#     ...
+#     tracing.tracer.end('dispatch', 'engine', started, {'button': '0.0'})
+#
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger('tracing')
+
+DEFAULT_SIZE = 1 << 16
+
+COMPLETE = 'X'
+INSTANT = 'i'
+ASYNC = 'async'
+
+
+class Span(object):
+    __slots__ = ('tracer', 'name', 'category', 'args', 'started')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.end(self.name, self.category, self.started, self.args)
+
+
+class Tracer(object):
+    """
+    Keeps the last <size> events (rounded up to a power of two). Recording takes no lock,
+    events of different threads only share an atomic counter.
+    """
+    enabled = True
+
+    def __init__(self, size=DEFAULT_SIZE):
+        size = 1 << max(int(size) - 1, 1).bit_length()
+        self.mask = size - 1
+        self.events = [None] * size
+        self.counter = itertools.count()
+        self.threads = {}
+        self.started = time.perf_counter()
+        self.pid = os.getpid()
+
+    @staticmethod
+    def begin():
+        return time.perf_counter()
+
+    def record(self, kind, name, category, started, duration, args, ident=None):
+        if ident is None:
+            ident = threading.get_ident()
+            if ident not in self.threads:
+                self.threads[ident] = threading.current_thread().name
+        self.events[next(self.counter) & self.mask] = (kind, name, category, started, duration, ident, args)
+
+    def end(self, name, category, started, args=None):
+        """
+        Records span <name> from <started> (a begin() value) until now on the calling thread
+        """
+        self.record(COMPLETE, name, category, started, time.perf_counter() - started, args)
+
+    def end_async(self, name, category, started, args=None):
+        """
+        Records span <name> which may overlap others on the same thread, like concurrent requests
+        """
+        self.record(ASYNC, name, category, started, time.perf_counter() - started, args)
+
+    def instant(self, name, category, args=None):
+        self.record(INSTANT, name, category, time.perf_counter(), 0.0, args)
+
+    def span(self, name, category, args=None):
+        """
+        Returns a context manager recording span <name> around its block
+        """
+        return Span(self, name, category, args)
+
+    def snapshot(self):
+        """
+        Returns the recorded events, oldest first
+        """
+        return sorted((event for event in list(self.events) if event is not None), key=lambda event: event[3])
+
+    def to_chrome(self):
+        """
+        Returns the events in the Chrome trace event format, times in microseconds
+        """
+        trace = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0, 'args': {'name': 'pyControlCast'}}]
+        for ident, name in list(self.threads.items()):
+            trace.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': ident, 'args': {'name': name}})
+
+        for number, (kind, name, category, started, duration, ident, args) in enumerate(self.snapshot()):
+            event = {
+                'name': name,
+                'cat': category,
+                'ts': round((started - self.started) * 1e6, 3),
+                'pid': self.pid,
+                'tid': ident,
+            }
+            if args:
+                event['args'] = args
+            if kind == COMPLETE:
+                trace.append(dict(event, ph=COMPLETE, dur=round(duration * 1e6, 3)))
+            elif kind == INSTANT:
+                trace.append(dict(event, ph=INSTANT, s='t'))
+            else:
+                trace.append(dict(event, ph='b', id=number))
+                trace.append(dict(event, ph='e', id=number, ts=round((started + duration - self.started) * 1e6, 3)))
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path):
+        with open(path, 'w') as trace_file:
+            json.dump(self.to_chrome(), trace_file)
+        log.info('Wrote trace to %s', path)
+
+
+class NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class NullTracer(object):
+    """
+    The tracer while tracing is off, records nothing
+    """
+    enabled = False
+
+    @staticmethod
+    def begin():
+        return 0.0
+
+    def end(self, name, category, started, args=None):
+        pass
+
+    def end_async(self, name, category, started, args=None):
+        pass
+
+    def instant(self, name, category, args=None):
+        pass
+
+    def span(self, name, category, args=None):
+        return NULL_SPAN
+
+    def dump(self, path):
+        pass
+
+
+tracer = NullTracer()
+
+
+def enable(size=DEFAULT_SIZE):
+    """
+    Starts tracing into a new ring buffer of <size> events, returns the tracer
+    """
+    global tracer
+    if not tracer.enabled:
+        tracer = Tracer(size)
+        log.info('Tracing enabled, keeping the last %d events', tracer.mask + 1)
+    return tracer
+
+
+def disable():
+    global tracer
+    tracer = NullTracer()
+
+
+def dump(path):
+    """
+    Writes the recorded events to <path>, does nothing while tracing is off
+    """
+    tracer.dump(path)
@@ -0,0 +1,339 @@
+# Simulated MIDI controllers for running without hardware.
+#
+# VirtualDevice plays the part of an attached controller: it feeds scripted or
+# generated input into the MIDI input port, records every message written to
+# the output port with its time and keeps the LED state the model would show.
+# Its backend attribute stands in for the rtmidi2 module:
+#
+#     device = VirtualDevice('launchpad')
+#     lp = launchpad.Launchpad(Midi(device.backend))
+#     lp.open()
+#     device.press(0, 0)
+#
+import collections
+import threading
+import time
+
+from lp import launchpad
+from lp.decoder import get_decoder, NOTE_ON, CONTROL_CHANGE
+
+# decoder model -> port name, the name the model classes search for is part of it
+PORT_NAMES = {
+    'launchpad': 'Launchpad S',
+    'launchpad_pro': 'Launchpad Pro',
+    'launchpad_mk2': 'Launchpad MK2',
+    'launch_control_xl': 'Launch Control XL',
+    'launchkey_mini': 'LaunchKey Mini',
+    'dicer': 'Dicer',
+}
+
+# the press message (status, data1) of every input of a model, as the hardware sends them.
+# Written down separately from lp.decoder, so the simulated input checks the decoder tables.
+LAYOUTS = {
+    # grid and right column: note 16 * y + x, automap row: CC 104..111
+    'launchpad': lambda: [(NOTE_ON, (y << 4) | x) for y in range(8) for x in range(9)] +
+                         [(CONTROL_CHANGE, number) for number in range(104, 112)],
+    # programmer layout: pads 11..88 are notes, the buttons around them CCs
+    'launchpad_pro': lambda: [(NOTE_ON if 1 <= number % 10 <= 8 and 11 <= number <= 88 else CONTROL_CHANGE, number)
+                              for number in range(1, 99) if number % 10 or 10 <= number <= 80],
+    # pads 11..88 and the right column 19..89 are notes, the top row CC 104..111
+    'launchpad_mk2': lambda: [(NOTE_ON, number) for number in range(11, 90) if number % 10] +
+                             [(CONTROL_CHANGE, number) for number in range(104, 112)],
+    # track focus and control buttons are notes, the arrows CCs, then knobs and faders
+    'launch_control_xl': lambda: [(NOTE_ON, number) for row in (41, 57, 73, 89) for number in range(row, row + 4)] +
+                                 [(CONTROL_CHANGE, number) for number in range(104, 108)] +
+                                 [(CONTROL_CHANGE, number)
+                                  for row in (13, 29, 49, 77) for number in range(row, row + 8)],
+    # keys on channel 1, drum pads 36..51 on channel 10, buttons CC 104..109 and knobs CC 21..28
+    'launchkey_mini': lambda: [(NOTE_ON, number) for number in range(128)] +
+                              [(NOTE_ON | 9, number) for number in range(36, 52)] +
+                              [(CONTROL_CHANGE, number) for number in range(104, 110)] +
+                              [(CONTROL_CHANGE, number) for number in range(21, 29)],
+    # notes 60..69 on channels 11..13 (master) and 14..16 (slave)
+    'dicer': lambda: [(status, number) for status in range(154, 160) for number in range(60, 70)],
+}
+
+MODEL_CLASSES = {
+    'launchpad': launchpad.Launchpad,
+    'launchpad_pro': launchpad.LaunchpadPro,
+    'launchpad_mk2': launchpad.LaunchpadMk2,
+    'launch_control_xl': launchpad.LaunchControlXL,
+    'launchkey_mini': launchpad.LaunchKeyMini,
+    'dicer': launchpad.Dicer,
+}
+
+
+class VirtualMidiIn(object):
+    """
+    Input port with the rtmidi2.MidiIn interface
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.ports = [device.port_name]
+        self.callback = None
+        self.messages = collections.deque()
+        self.ignored = ()
+
+    def open_port(self, port):
+        self.device.inputs.append(self)
+
+    def close_port(self):
+        if self in self.device.inputs:
+            self.device.inputs.remove(self)
+
+    def ignore_types(self, midi_sysex=True, midi_time=True, midi_sense=True):
+        self.ignored = tuple(status for status, ignore in ((0xf0, midi_sysex), (0xf8, midi_time), (0xfe, midi_sense))
+                             if ignore)
+
+    def get_message(self):
+        try:
+            return self.messages.popleft()
+        except IndexError:
+            return None
+
+    def receive(self, message, delta):
+        if message[0] in self.ignored:
+            return
+        callback = self.callback
+        if callback is not None:
+            callback(list(message), delta)
+        else:
+            self.messages.append(list(message))
+
+
+class VirtualMidiOut(object):
+    """
+    Output port with the rtmidi2.MidiOut interface, everything sent goes to the device
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.ports = [device.port_name]
+
+    def open_port(self, port):
+        pass
+
+    def close_port(self):
+        pass
+
+    def send_message(self, message):
+        self.device.receive(list(message))
+
+    def send_raw(self, *message):
+        self.device.receive(list(message))
+
+    def send_messages(self, messagetype, messages):
+        # rtmidi2: <messages> are (channel, value1, value2) tuples
+        for channel, value1, value2 in messages:
+            self.device.receive([messagetype | channel, value1, value2])
+
+
+class VirtualBackend(object):
+    """
+    Stands in for the rtmidi2 module, MidiIn() and MidiOut() create ports of <device>
+    """
+
+    def __init__(self, device):
+        self.device = device
+
+    def MidiIn(self):
+        return VirtualMidiIn(self.device)
+
+    def MidiOut(self):
+        return VirtualMidiOut(self.device)
+
+
+class VirtualDevice(object):
+    """
+    Simulated controller of <model> (see PORT_NAMES).
+    Input goes to every opened input port, either right away with press(), release() and send(),
+    or timed with play(). Output is kept in <output> as (seconds since creation, message)
+    and applied to <leds>, the LED state of the model.
+    """
+
+    def __init__(self, model='launchpad'):
+        if model not in PORT_NAMES:
+            raise ValueError(f'Unknown model {model}')
+        self.model = model
+        self.port_name = PORT_NAMES[model]
+        self.decoder = get_decoder(model)
+        self.backend = VirtualBackend(self)
+
+        self.inputs = []
+        self.clock = time.perf_counter()
+        self.last_input = self.clock
+
+        self.lock = threading.Lock()
+        self.output = []
+        self.leds = {}
+        self.rapid = 0
+
+        self.player = None
+        self.messages = self.input_messages()
+
+    def open(self, **kwargs):
+        """
+        Returns an opened instance of the model's class using this device
+        """
+        lp = MODEL_CLASSES[self.model](launchpad.Midi(self.backend), **kwargs)
+        lp.open(name=self.port_name)
+        return lp
+
+    def input_messages(self):
+        """
+        Returns the press message (status, data1) of the model's inputs (see LAYOUTS) by button index.
+        Inputs the decoder doesn't know are left out.
+        """
+        messages = {}
+        for status, data1 in LAYOUTS[self.model]():
+            index = self.decoder.lookup(status, data1)
+            if index >= 0:
+                messages.setdefault(index, (status, data1))
+        return messages
+
+    # input
+
+    def send(self, message):
+        """
+        Delivers a raw <message> to all opened input ports
+        """
+        now = time.perf_counter()
+        delta = now - self.last_input
+        self.last_input = now
+        for port in list(self.inputs):
+            port.receive(message, delta)
+
+    def message(self, index, value):
+        status, data1 = self.messages[index]
+        return [status, data1, value]
+
+    def press(self, x, y, velocity=127):
+        self.send(self.message(self.index_of(x, y), velocity))
+
+    def release(self, x, y):
+        self.send(self.message(self.index_of(x, y), 0))
+
+    def tap(self, x, y, velocity=127):
+        self.press(x, y, velocity)
+        self.release(x, y)
+
+    def index_of(self, x, y):
+        index = self.decoder.index_of(x, y)
+        if index < 0 or index not in self.messages:
+            raise ValueError(f'{self.model} has no button {x}.{y}')
+        return index
+
+    def play(self, events, wait=True):
+        """
+        Sends <events>, a list of (seconds from now, message), at their time from a player thread.
+        Returns after the last event unless <wait> is False.
+        """
+        events = sorted(events, key=lambda event: event[0])
+
+        def run():
+            started = time.perf_counter()
+            for at, message in events:
+                delay = started + at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.send(message)
+
+        self.player = threading.Thread(target=run, name='virtual-input', daemon=True)
+        self.player.start()
+        if wait:
+            self.player.join()
+
+    def generate(self, positions, interval=0.01, hold=0.005, repeat=1):
+        """
+        Returns a press/release event list for play(): every position of <positions> in turn,
+        <interval> seconds apart, each held for <hold> seconds, all of it <repeat> times
+        """
+        events = []
+        at = 0.0
+        for _ in range(repeat):
+            for x, y in positions:
+                index = self.index_of(x, y)
+                events.append((at, self.message(index, 127)))
+                events.append((at + hold, self.message(index, 0)))
+                at += interval
+        return events
+
+    # output
+
+    def receive(self, message):
+        with self.lock:
+            self.output.append((time.perf_counter() - self.clock, message))
+            self.apply(message)
+
+    def clear_output(self):
+        with self.lock:
+            self.output = []
+
+    def apply(self, message):
+        if self.model == 'launchpad':
+            self.apply_launchpad(message)
+        elif self.model in ('launchpad_pro', 'launchpad_mk2'):
+            self.apply_rgb(message)
+        elif self.model == 'dicer':
+            if len(message) == 3:
+                self.leds[(message[0], message[1])] = message[2]
+        elif len(message) == 3 and (message[0] & 0xf0) in (NOTE_ON, CONTROL_CHANGE):
+            self.leds[message[1]] = message[2]
+
+    def apply_launchpad(self, message):
+        status = message[0]
+        if status != 146:
+            self.rapid = 0
+
+        if status == 176 and message[1] == 0 and message[2] == 0:
+            self.leds.clear()
+        elif status == 176 and message[1] >= 104:
+            self.leds[200 + message[1] - 104] = message[2]
+        elif status == 144:
+            self.leds[message[1]] = message[2]
+        elif status == 146:
+            # rapid update: grid by rows, then right column, then automap row, two LEDs per message
+            for led in message[1:3]:
+                cell = self.rapid
+                if cell < 64:
+                    number = ((cell >> 3) << 4) | (cell & 7)
+                elif cell < 72:
+                    number = ((cell - 64) << 4) | 8
+                else:
+                    number = 200 + cell - 72
+                self.leds[number] = led
+                self.rapid = (cell + 1) % 80
+
+    def apply_rgb(self, message):
+        cls = MODEL_CLASSES[self.model]
+        status = message[0]
+        if status in (144, 176) and len(message) == 3:
+            self.leds[message[1]] = message[2]
+            return
+        if status != 0xf0 or message[1:6] != [0, 32, 41, 2, cls.SYSEX_DEVICE]:
+            return
+
+        command, data = message[6], message[7:-1]
+        if command == cls.SYSEX_LED_CODES:
+            for offset in range(0, len(data) - 1, 2):
+                self.leds[data[offset]] = data[offset + 1]
+        elif command == cls.SYSEX_LED_RGB:
+            for offset in range(0, len(data) - 3, 4):
+                self.leds[data[offset]] = tuple(data[offset + 1:offset + 4])
+        elif command == cls.SYSEX_LED_COLUMN:
+            for number in cls.COLUMNS[data[0]]:
+                self.leds[number] = data[1]
+        elif command == cls.SYSEX_LED_ROW:
+            for number in cls.ROWS[data[0]]:
+                self.leds[number] = data[1]
+        elif command == cls.SYSEX_LED_ALL:
+            for number in cls.LEDS:
+                self.leds[number] = data[0]
+
+    def stats(self):
+        with self.lock:
+            messages = len(self.output)
+            size = sum(len(message) for _, message in self.output)
+            span = self.output[-1][0] - self.output[0][0] if messages > 1 else 0.0
+        return {'messages': messages, 'bytes': size, 'span': span}
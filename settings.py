@@ -10,3 +10,7 @@ else:
 LOG_FOLDER = os.path.join(APP_FOLDER, "logs")
 if not os.path.exists(LOG_FOLDER):
     os.makedirs(LOG_FOLDER)
+
+CACHE_FOLDER = os.path.join(APP_FOLDER, "cache")
+if not os.path.exists(CACHE_FOLDER):
+    os.makedirs(CACHE_FOLDER)
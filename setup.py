@@ -6,7 +6,7 @@ setup(
     name='PyControlCast',
     version=VERSION,
     packages=['', 'util'],
-    requires=['python-rtmidi', 'pyautogui', 'pydub', 'dotmap', 'PyYAML'],
+    requires=['python-rtmidi', 'pyautogui', 'pydub', 'PyYAML', 'websockets', 'numpy', 'PyAudio'],
     url='https://github.com/DeForce/pyControlCast',
     license='',
     author='CzT/DeForce',
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lp.virtual import VirtualDevice  # noqa: E402
+
+
+@pytest.fixture
+def open_device():
+    """
+    Returns open(model, **kwargs) -> (VirtualDevice, opened device class), closed after the test
+    """
+    opened = []
+
+    def open_device(model='launchpad', **kwargs):
+        device = VirtualDevice(model)
+        lp = device.open(**kwargs)
+        lp.midi.drain()
+        device.clear_output()
+        opened.append(lp)
+        return device, lp
+
+    yield open_device
+    for lp in opened:
+        lp.close()
@@ -0,0 +1,37 @@
+import time
+
+from lp.animation import Animator, FrameTarget, RGBTarget, Fade
+from lp.launchpad import Launchpad, LaunchpadPro
+
+
+def test_overlay_budget_never_holds_back_frame_changes(open_device):
+    device, lp = open_device()
+    lp.reset()
+    target = FrameTarget(lp)
+    cells = {(x, y): (3, 3) for x in range(8) for y in range(4)}
+
+    lp.frame_set(0, 7, 3, 0)
+    assert target.render(cells, 4) == 5
+    lp.midi.drain()
+    assert device.leds[(7 << 4) | 0] == Launchpad.led_get_color(3, 0)
+
+    # going back from the overlay to the frame is animation as well
+    lp.frame_set(1, 7, 0, 3)
+    assert target.render({}, 2) == 3
+    lp.midi.drain()
+    assert device.leds[(7 << 4) | 1] == Launchpad.led_get_color(0, 3)
+
+
+def test_rgb_effects_end_on_the_base_color(open_device):
+    device, lp = open_device('launchpad_pro', color_mode=LaunchpadPro.COLOR_EXACT)
+    animator = Animator(RGBTarget(lp))
+    animator.set_base({(0, 1): (10, 20, 30)})
+
+    animator.add(Fade([(0, 1), (1, 1)], (63, 0, 0), (0, 63, 0), duration=0.01))
+    now = time.perf_counter()
+    animator.render(now)
+    time.sleep(0.02)
+    animator.render(time.perf_counter())
+    lp.midi.drain()
+    assert device.leds[lp.led_number_xy(0, 1)] == (10, 20, 30)
+    assert device.leds[lp.led_number_xy(1, 1)] == (0, 0, 0)
@@ -0,0 +1,23 @@
+import pytest
+
+from lp.launchpad import LaunchpadPro
+from lp.palette import rgb_to_code
+
+
+@pytest.mark.parametrize('model', ['launchpad_pro', 'launchpad_mk2'])
+def test_rgb_is_exact_by_default(open_device, model):
+    device, lp = open_device(model)
+    assert lp.color_mode == LaunchpadPro.COLOR_EXACT
+    lp.led_ctrl_raw(81, 10, 20, 30)
+    lp.midi.drain()
+    message = device.output[-1][1]
+    assert message[0] == 0xf0 and message[6] == lp.SYSEX_LED_RGB
+    assert device.leds[81] == (10, 20, 30)
+
+
+@pytest.mark.parametrize('model', ['launchpad_pro', 'launchpad_mk2'])
+def test_approximate_rgb_sends_palette_codes(open_device, model):
+    device, lp = open_device(model, color_mode=LaunchpadPro.COLOR_APPROXIMATE)
+    lp.led_ctrl_raw(81, 63, 0, 0)
+    lp.midi.drain()
+    assert device.output[-1][1] == [144, 81, rgb_to_code(63, 0, 0)]
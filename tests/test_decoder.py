@@ -0,0 +1,163 @@
+import pytest
+
+from lp.decoder import get_decoder, BUILDERS, NOTE_ON, NOTE_OFF, KeyEvent
+from lp import virtual
+from lp.virtual import VirtualDevice
+
+# (status, data1) -> (x, y, control) of every model, written down from the programmer's references
+# instead of the decoder tables, so a wrong table entry shows up
+LAYOUTS = {
+    'launchpad': [
+        # grid and right column: note 16 * y + x, automap row: CC 104..111 as y = -1
+        ((144, 0x00), (0, 0, False)),
+        ((144, 0x32), (2, 3, False)),
+        ((144, 0x77), (7, 7, False)),
+        ((144, 0x08), (8, 0, False)),
+        ((144, 0x78), (8, 7, False)),
+        ((176, 104), (0, -1, False)),
+        ((176, 111), (7, -1, False)),
+    ],
+    'launchpad_pro': [
+        # programmer layout: pads 11 (bottom left) to 88, buttons around them are CCs
+        ((144, 81), (0, 1, False)),
+        ((144, 11), (0, 8, False)),
+        ((144, 88), (7, 1, False)),
+        ((176, 91), (0, 0, False)),
+        ((176, 98), (7, 0, False)),
+        ((176, 89), (8, 1, False)),
+        ((176, 19), (8, 8, False)),
+        ((176, 80), (9, 1, False)),
+        ((176, 1), (0, 9, False)),
+    ],
+    'launchpad_mk2': [
+        # pads 11 to 88 and the right column 19 to 89 as notes, the top row as CC 104..111
+        ((144, 81), (0, 1, False)),
+        ((144, 11), (0, 8, False)),
+        ((144, 89), (8, 1, False)),
+        ((144, 19), (8, 8, False)),
+        ((176, 104), (0, 0, False)),
+        ((176, 111), (7, 0, False)),
+    ],
+    'launch_control_xl': [
+        # track focus and control buttons are notes, the arrows CC 104..107, the rest are knobs and faders
+        ((144, 41), (41, 0, False)),
+        ((144, 60), (60, 0, False)),
+        ((144, 92), (92, 0, False)),
+        ((176, 104), (104, 0, False)),
+        ((176, 107), (107, 0, False)),
+        ((176, 13), (13, 0, True)),
+        ((176, 77), (77, 0, True)),
+    ],
+    'launchkey_mini': [
+        # keys on channel 1, drum pads 36..51 on channel 10, buttons CC 104..109
+        ((144, 60), (60, 0, False)),
+        ((153, 36), (36, 0, False)),
+        ((153, 51), (51, 0, False)),
+        ((176, 104), (104, 0, False)),
+        ((176, 109), (109, 0, False)),
+        ((176, 21), (21, 0, True)),
+    ],
+    'dicer': [
+        # notes 60..69 on channels 11..13 (master) and 14..16 (slave), in legacy decade numbering
+        ((154, 60), (1, 0, False)),
+        ((155, 65), (16, 0, False)),
+        ((156, 69), (30, 0, False)),
+        ((157, 60), (101, 0, False)),
+        ((159, 69), (130, 0, False)),
+    ],
+}
+
+
+@pytest.mark.parametrize('model', sorted(BUILDERS))
+def test_press_and_release_round_trip(model):
+    decoder = get_decoder(model)
+    device = VirtualDevice(model)
+    assert device.messages
+
+    for index, (status, data1) in device.messages.items():
+        assert decoder.lookup(status, data1) == index
+
+        event = decoder.decode(device.message(index, 100), 1.5)
+        assert event.index == index
+        assert event.value == 100
+        assert event.timestamp == 1.5
+        assert event.pressed == (not event.control)
+
+        event = decoder.decode(device.message(index, 0))
+        assert event.index == index
+        assert not event.pressed
+
+        if status & 0xf0 == NOTE_ON:
+            # note off is a release whatever its velocity
+            event = decoder.decode([NOTE_OFF | (status & 0x0f), data1, 64])
+            assert event.index == index
+            assert event.value == 0
+            assert not event.pressed
+
+
+@pytest.mark.parametrize('model', sorted(BUILDERS))
+def test_positions_round_trip(model):
+    decoder = get_decoder(model)
+    for (x, y), index in decoder.positions.items():
+        assert decoder.index_of(x, y) == index
+        assert (decoder.x[index], decoder.y[index]) == (x, y)
+
+
+@pytest.mark.parametrize('model', sorted(BUILDERS))
+def test_batch_matches_single_decoding(model):
+    decoder = get_decoder(model)
+    device = VirtualDevice(model)
+    messages = [[0xf8], [0xf0, 0, 0xf7], [NOTE_ON, 0x7f, 0x7f]]
+    for index in device.messages:
+        messages.append(device.message(index, 127))
+        messages.append(device.message(index, 0))
+
+    expected = []
+    event = KeyEvent()
+    for message in messages:
+        if decoder.decode(message, 0.0, event) is not None:
+            expected.append((event.index, event.value))
+
+    indices, values = decoder.allocate_batch(len(messages))
+    count = decoder.decode_batch(messages, indices, values)
+    assert list(zip(indices[:count], values[:count])) == expected
+
+
+def test_unknown_messages():
+    decoder = get_decoder('launchpad')
+    assert decoder.decode([NOTE_ON, 9]) is None
+    assert decoder.decode([0xf0, 0, 0]) is None
+    assert decoder.decode([0x70, 0, 0]) is None
+    assert decoder.lookup(0xf8, 0) == -1
+    assert decoder.index_of(9, 9) == -1
+
+
+def test_batch_stops_at_the_arrays():
+    decoder = get_decoder('launchpad')
+    message = VirtualDevice('launchpad').message(decoder.index_of(0, 0), 127)
+    indices, values = decoder.allocate_batch(2)
+    assert decoder.decode_batch([message] * 5, indices, values) == 2
+
+
+@pytest.mark.parametrize('model', sorted(LAYOUTS))
+def test_layout(model):
+    decoder = get_decoder(model)
+    for (status, data1), (x, y, control) in LAYOUTS[model]:
+        event = decoder.decode([status, data1, 127])
+        assert event is not None, (status, data1)
+        assert (event.x, event.y, event.control) == (x, y, control), (status, data1)
+
+
+@pytest.mark.parametrize('model', sorted(LAYOUTS))
+def test_virtual_device_sends_the_layout(model):
+    decoder = get_decoder(model)
+    device = VirtualDevice(model)
+    for (status, data1), _ in LAYOUTS[model]:
+        assert device.message(decoder.lookup(status, data1), 127) == [status, data1, 127]
+
+
+@pytest.mark.parametrize('model', sorted(BUILDERS))
+def test_every_hardware_input_is_decoded(model):
+    decoder = get_decoder(model)
+    for status, data1 in virtual.LAYOUTS[model]():
+        assert decoder.lookup(status, data1) >= 0, (status, data1)
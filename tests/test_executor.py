@@ -0,0 +1,53 @@
+import threading
+
+from lp.executor import ActionExecutor
+
+
+def test_call_later_runs_while_the_pools_are_full():
+    executor = ActionExecutor({'sound': {'workers': 1, 'queue': 1}})
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    try:
+        executor.submit('sound', block)
+        assert started.wait(5)
+        assert executor.submit('sound', release.wait, 5)
+        assert not executor.submit('sound', release.wait, 5)
+
+        called = threading.Event()
+        executor.call_later(0.01, called.set)
+        assert called.wait(5)
+        assert executor.stats()['sound']['dropped'] == 1
+    finally:
+        release.set()
+        executor.stop()
+
+
+def test_timers_run_in_due_order():
+    executor = ActionExecutor()
+    calls = []
+    done = threading.Event()
+    try:
+        executor.call_later(0.05, done.set)
+        executor.call_later(0.02, calls.append, 'second')
+        executor.call_later(0.01, calls.append, 'first')
+        executor.submit_later('sound', 0.03, calls.append, 'pooled')
+        assert done.wait(5)
+        assert calls == ['first', 'second', 'pooled']
+    finally:
+        executor.stop()
+
+
+def test_failing_timer_call_keeps_the_timer_running():
+    executor = ActionExecutor()
+    called = threading.Event()
+    try:
+        executor.call_later(0, lambda: 1 / 0)
+        executor.call_later(0.01, called.set)
+        assert called.wait(5)
+    finally:
+        executor.stop()
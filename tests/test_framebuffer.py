@@ -0,0 +1,90 @@
+from lp.launchpad import Launchpad
+
+
+def buffer_controls(device):
+    return [message[2] for _, message in device.output if message[:2] == [176, 0]]
+
+
+def test_flush_sends_only_changed_cells(open_device):
+    device, lp = open_device()
+    lp.reset()
+    lp.frame_fill(0, 0)
+    lp.flush()
+    lp.midi.drain()
+    device.clear_output()
+
+    lp.frame_set(1, 2, 3, 0)
+    lp.frame_set(0, -1, 0, 3)
+    assert lp.flush() == 2
+    assert lp.flush() == 0
+    lp.midi.drain()
+    assert [message for _, message in device.output] == [
+        [144, (2 << 4) | 1, Launchpad.led_get_color(3, 0)],
+        [176, 104, Launchpad.led_get_color(0, 3)],
+    ]
+
+
+def test_full_redraw_uses_rapid_update(open_device):
+    device, lp = open_device()
+    lp.reset()
+    for x in range(8):
+        for y in range(8):
+            lp.frame_set(x, y, x % 4, y % 4)
+    assert lp.flush() == Launchpad.RAPID_COST + 1
+    lp.midi.drain()
+    for x in range(8):
+        for y in range(8):
+            assert device.leds[(y << 4) | x] == Launchpad.led_get_color(x % 4, y % 4)
+
+
+def test_overlay_hides_the_frame_until_cleared(open_device):
+    device, lp = open_device()
+    lp.frame_fill(0, 0)
+    lp.flush()
+    lp.frame_overlay({(3, 3): (3, 3)})
+    lp.flush()
+    lp.midi.drain()
+    assert device.leds[(3 << 4) | 3] == Launchpad.led_get_color(3, 3)
+    assert lp.frame_get(3, 3) == Launchpad.led_get_color(0, 0)
+
+    lp.frame_overlay({})
+    lp.flush()
+    lp.midi.drain()
+    assert device.leds[(3 << 4) | 3] == Launchpad.led_get_color(0, 0)
+
+
+def test_swap_flush_shows_the_frame(open_device):
+    device, lp = open_device()
+    lp.frame_fill(1, 0)
+    lp.flush(swap=True)
+    assert lp.shown == lp.frame
+    assert lp.flush() == 0
+    lp.midi.drain()
+    # drawn into the hidden buffer, then shown
+    controls = buffer_controls(device)
+    assert controls[0] & 3 != controls[-1] & 3
+
+
+def test_flashing_enables_flash_mode(open_device):
+    device, lp = open_device()
+    lp.frame_set(2, 2, 3, 0, flash=True)
+    lp.flush()
+    assert lp.flash_mode
+    lp.midi.drain()
+    assert buffer_controls(device)[-1] & 8
+
+
+def test_flash_survives_swap_flush(open_device):
+    device, lp = open_device()
+    lp.frame_set(2, 2, 3, 0, flash=True)
+    lp.flush()
+    lp.midi.drain()
+    device.clear_output()
+
+    lp.frame_set(4, 4, 0, 3)
+    lp.flush(swap=True)
+    lp.midi.drain()
+    assert lp.flash_mode
+    controls = buffer_controls(device)
+    assert controls
+    assert all(control & 8 for control in controls)
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from lp.launchpad import Midi
+from lp.virtual import VirtualDevice
+
+
+def sent(device):
+    return [message for _, message in device.output]
+
+
+def open_midi():
+    device = VirtualDevice('launchpad')
+    midi = Midi(device.backend)
+    midi.open_output(0)
+    return device, midi
+
+
+def test_led_writes_coalesce_while_queued():
+    device, midi = open_midi()
+    try:
+        # the writer can't take the queue while the condition is held
+        with midi.out_condition:
+            midi.raw_write(144, 0, 1)
+            midi.raw_write(144, 1, 2)
+            midi.raw_write(144, 0, 3)
+            midi.raw_write(176, 104, 4)
+            midi.raw_write(176, 104, 5)
+        assert midi.drain()
+        assert sent(device) == [[144, 0, 3], [144, 1, 2], [176, 104, 5]]
+        assert midi.stats()['coalesced'] == 2
+    finally:
+        midi.close_output()
+
+
+def test_other_messages_are_barriers():
+    device, midi = open_midi()
+    try:
+        with midi.out_condition:
+            midi.raw_write(144, 0, 1)
+            midi.raw_write(176, 0, 40)
+            midi.raw_write(144, 0, 2)
+            midi.raw_write_system_exclusive([0, 32, 41])
+            midi.raw_write(144, 0, 3)
+        assert midi.drain()
+        assert sent(device) == [[144, 0, 1], [176, 0, 40], [144, 0, 2], [0xf0, 0, 32, 41, 0xf7], [144, 0, 3]]
+    finally:
+        midi.close_output()
+
+
+def test_written_messages_arrive_in_order_from_many_threads():
+    device, midi = open_midi()
+    try:
+        def write(note):
+            for value in range(100):
+                midi.raw_write(144, note, value)
+
+        threads = [threading.Thread(target=write, args=(note,)) for note in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert midi.drain()
+
+        last = {}
+        for status, note, value in sent(device):
+            assert value > last.get(note, -1)
+            last[note] = value
+        assert last == {note: 99 for note in range(8)}
+    finally:
+        midi.close_output()
+
+
+class RecordingOut(object):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def send_message(self, message):
+        time.sleep(self.delay)
+        self.calls.append(('single', list(message)))
+
+    def send_messages(self, messagetype, messages):
+        time.sleep(self.delay)
+        self.calls.append(('many', messagetype, [tuple(message) for message in messages]))
+
+
+def test_runs_of_the_same_status_are_sent_together():
+    midi = Midi(VirtualDevice('launchpad').backend)
+    midi.dev_out = RecordingOut()
+    midi.send_messages([[144, 0, 1], [144, 1, 2], [176, 104, 3], [0xf0, 1, 0xf7], [146, 5, 6], [146, 7, 8]])
+    assert midi.dev_out.calls == [
+        ('many', 144, [(0, 0, 1), (0, 1, 2)]),
+        ('single', [176, 104, 3]),
+        ('single', [0xf0, 1, 0xf7]),
+        ('many', 144, [(2, 5, 6), (2, 7, 8)]),
+    ]
+
+
+def test_drain_waits_until_the_batch_is_sent():
+    device, midi = open_midi()
+    midi.dev_out = RecordingOut(delay=0.05)
+    try:
+        midi.raw_write(176, 0, 40)
+        # give the writer time to take the message off the queue
+        time.sleep(0.01)
+        assert midi.drain()
+        assert midi.dev_out.calls == [('single', [176, 0, 40])]
+    finally:
+        midi.stop_writer()
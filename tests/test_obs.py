@@ -0,0 +1,185 @@
+import asyncio
+import time
+
+import pytest
+
+from bench.backends import bench_config
+from bench.obs_stub import OBSStub
+from config import compile_config
+from lp.metrics import Metrics
+from lp.obs_websocket import OBS, OBSState, TransformManager
+
+
+def obs_config(port, **settings):
+    data = bench_config(obs_port=port).to_dict()
+    data['obs'].update(settings)
+    return compile_config(data)
+
+
+def wait_connected(client, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not client.connected:
+        assert time.perf_counter() < deadline, 'Not connected to the OBS stub'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def obs():
+    stub = OBSStub().start()
+    client = OBS(bench_config(obs_port=stub.port))
+    wait_connected(client)
+    stub.clear()
+    yield client, stub
+    client.close()
+    stub.stop()
+
+
+def wait_idle(client, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while client.stats()['running']:
+        assert time.perf_counter() < deadline, 'OBS actions still running'
+        time.sleep(0.01)
+
+
+def requests(stub):
+    return [name for _, name in stub.received if name != 'GetVersion']
+
+
+def schedule(client, *actions):
+    async def run():
+        for request, kwargs in actions:
+            client.schedule(request, kwargs)
+    client.submit(run()).result(5)
+
+
+def test_scene_switches_go_first(obs):
+    client, stub = obs
+    client.max_running = 1
+    schedule(client,
+             ('show_and_hide_scene_item', {'source': 'Camera', 'timeout': 0.2}),
+             ('toggle_mute', {'source': 'Mic'}),
+             ('switch_scene', {'scene': 'Break'}))
+
+    # the item stays visible without keeping the others waiting
+    stub.wait_for('ToggleMute', 1)
+    assert requests(stub) == ['SetSceneItemProperties', 'SetCurrentScene', 'ToggleMute']
+    stub.wait_for('SetSceneItemProperties', 2)
+    assert requests(stub)[-1] == 'SetSceneItemProperties'
+    assert client.stats()['waiting'] == 0
+
+
+def test_actions_are_dropped_when_too_many_wait(obs):
+    client, stub = obs
+    client.max_running = 1
+    client.max_waiting = 1
+    schedule(client, *[('show_and_hide_scene_item', {'source': 'Camera', 'timeout': 0.05})] * 3)
+    assert client.stats()['dropped'] == 1
+
+    wait_idle(client)
+    stub.wait_for('SetSceneItemProperties', 4)
+    time.sleep(0.1)
+    assert len(stub.times('SetSceneItemProperties')) == 4
+
+
+class HeldClient(object):
+    """
+    Client whose requests wait until the test answers them
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def on(self, event, handler):
+        pass
+
+    async def call(self, request, **fields):
+        future = asyncio.get_running_loop().create_future()
+        self.calls.append(future)
+        return await future
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_only_the_latest_transform_write_unlocks():
+    async def run():
+        client = HeldClient()
+        state = OBSState(client)
+        key = 'Scene', 'Camera'
+        state.transforms[key] = {'scale_x': 1.0, 'scale_y': 1.0, 'position_x': 0, 'position_y': 0}
+        transforms = TransformManager(client, state, interval=0)
+
+        # every change starts a flush, the second one while the first write is in flight
+        await transforms.scale(*key, 2, 2)
+        await settle()
+        await transforms.scale(*key, 2, 2)
+        await settle()
+        assert len(client.calls) == 2
+
+        # the first write finishing must not let events overwrite the newer local transform
+        client.calls[0].set_result({})
+        await settle()
+        assert key in state.locked
+        state.item_transform_changed({'scene-name': 'Scene', 'item-name': 'Camera',
+                                      'transform': {'scale': {'x': 2.0, 'y': 2.0}}})
+        assert state.transforms[key]['scale_x'] == 4.0
+
+        client.calls[1].set_result({})
+        await settle()
+        assert key not in state.locked
+        assert not transforms.writes
+
+    asyncio.run(run())
+
+
+def pressed(metrics):
+    metrics.press(0.0, time.perf_counter())
+    return metrics.begin('obs')
+
+
+def test_presses_dropped_during_an_outage_are_counted():
+    stub = OBSStub().start()
+    port = stub.port
+    stub.stop()
+    client = OBS(obs_config(port, queue_size=1, backoff_min=60))
+    metrics = Metrics()
+    try:
+        old = time.monotonic() - 60
+        client.submit(client.perform('toggle_mute', {'source': 'Mic'}, old, pressed(metrics))).result(5)
+        # the queue is full, the first one goes
+        client.submit(client.perform('toggle_mute', {'source': 'Mic'}, old, pressed(metrics))).result(5)
+
+        async def replay():
+            client.replay()
+        # and the second one expired
+        client.submit(replay()).result(5)
+    finally:
+        client.close()
+
+    snapshot = metrics.snapshot()['obs']
+    assert snapshot['dropped']['count'] == 2
+    assert 'total' not in snapshot
+    assert client.stats()['expired'] == 1
+
+
+def test_supervisor_survives_unexpected_errors(monkeypatch):
+    failures = []
+    load = OBSState.load
+
+    async def broken_load(state):
+        if not failures:
+            failures.append(True)
+            raise KeyError('current-scene')
+        return await load(state)
+
+    monkeypatch.setattr(OBSState, 'load', broken_load)
+    stub = OBSStub().start()
+    client = OBS(obs_config(stub.port, backoff_min=0.01))
+    try:
+        wait_connected(client)
+        assert failures
+    finally:
+        client.close()
+        stub.stop()
@@ -0,0 +1,160 @@
+import pytest
+
+from bench.backends import BenchEngine, bench_config, start_engine, write_sound
+from config import compile_config
+from lp.init import PREWARM_FAILED_COLOR
+from lp.launchpad import Midi
+from lp.virtual import VirtualDevice
+
+LED_FLASH = 8
+LED_FLAGS = 12
+
+
+@pytest.fixture
+def engine():
+    device, lp = start_engine(bench_config(press_feedback=False))
+    lp.lp.midi.drain()
+    yield device, lp
+    lp.stop()
+
+
+def flashing(lp, x, y):
+    return lp.lp.frame_get(x, y) & LED_FLAGS == LED_FLASH
+
+
+def test_switch_swaps_dispatch_and_frame(engine):
+    device, lp = engine
+    assert lp.active_profile == 'bench'
+    bench = lp.profiles['bench']
+
+    lp.switch_profile('other')
+    assert lp.active_profile == 'other'
+    assert lp.dispatch is lp.profiles['other'].dispatch
+    assert lp.lp.frame == lp.profiles['other'].frame
+    lp.lp.midi.drain()
+    # swapped in through the hidden buffer, the buffer flags of the writes differ
+    assert device.leds[0] & ~LED_FLAGS == lp.lp.led_get_color(0, 0) & ~LED_FLAGS
+    assert device.leds[1] & ~LED_FLAGS == lp.lp.led_get_color(0, 0) & ~LED_FLAGS
+
+    lp.switch_profile('bench')
+    assert lp.dispatch is bench.dispatch
+    assert lp.lp.frame == bench.frame
+
+
+def test_profile_button_switches(engine):
+    device, lp = engine
+    switched = []
+    lp.add_profile_listener(switched.append)
+
+    device.tap(1, -1)
+    assert lp.active_profile == 'other'
+    assert switched == ['other']
+
+
+def test_unknown_profile_is_ignored(engine):
+    _, lp = engine
+    lp.switch_profile('missing')
+    assert lp.active_profile == 'bench'
+
+
+def test_flashing_survives_switch(engine):
+    _, lp = engine
+    lp.flash_button((0, 0), True)
+    assert flashing(lp, 0, 0)
+
+    lp.switch_profile('other')
+    assert not flashing(lp, 0, 0)
+    lp.switch_profile('bench')
+    assert flashing(lp, 0, 0)
+    assert lp.lp.flash_mode
+
+    lp.flash_button((0, 0), False)
+    assert not flashing(lp, 0, 0)
+    assert lp.profiles['bench'].frame[lp.lp.frame_index(0, 0)] & LED_FLAGS != LED_FLASH
+
+
+def test_obs_indicator_follows_the_active_profile(engine):
+    _, lp = engine
+    lp.obs_status(False)
+    assert flashing(lp, 0, -1)
+
+    lp.switch_profile('other')
+    assert flashing(lp, 1, -1)
+    assert not flashing(lp, 0, -1)
+
+    lp.obs_status(True)
+    assert not flashing(lp, 1, -1)
+
+
+def test_flashing_survives_reload(engine):
+    _, lp = engine
+    lp.flash_button((0, 0), True)
+
+    data = lp.config.to_dict()
+    data['profiles']['bench']['buttons']['1.0']['color'] = {'red': 0, 'green': 3}
+    lp.reload(compile_config(data))
+    assert flashing(lp, 0, 0)
+    assert lp.lp.frame_get(1, 0) == lp.lp.led_get_color(0, 3)
+
+    data['profiles']['extra'] = {'order': 2, 'buttons': {}}
+    lp.reload(compile_config(data))
+    assert 'extra' in lp.profiles
+    assert flashing(lp, 0, 0)
+
+
+def test_bad_reload_keeps_the_running_config(engine):
+    _, lp = engine
+    running = lp.config
+    data = running.to_dict()
+    data['profiles']['bench']['buttons']['1.0']['action'] = [{'unknown': {}}]
+    with pytest.raises(ValueError):
+        lp.reload(compile_config(data))
+    assert lp.config is running
+    assert lp.profiles['bench'].buttons[(1, 0)]['red'] == 3
+
+
+class SettingsEngine(BenchEngine):
+    """
+    Keeps the sound settings the sound backend was loaded with
+    """
+
+    def load_sound(self):
+        self.sound_settings = self.config.get('sound', {}).to_dict()
+        super(SettingsEngine, self).load_sound()
+
+
+def test_reload_loads_new_backends_with_the_new_config(tmp_path):
+    lp = SettingsEngine(bench_config(), Midi(VirtualDevice('launchpad').backend))
+    try:
+        data = lp.config.to_dict()
+        data['sound'] = {'prewarm': False, 'cache_mb': 1}
+        data['profiles']['bench']['buttons']['0.1'] = {
+            'color': {'red': 0, 'green': 3},
+            'action': [{'sound': {'path': write_sound(str(tmp_path / 'new.wav'))}}],
+        }
+        lp.reload(compile_config(data))
+        assert lp.sound_settings['cache_mb'] == 1
+        assert (0, 1) in lp.buttons
+    finally:
+        lp.stop()
+
+
+def test_missing_sound_file_marks_only_its_button(tmp_path):
+    config = bench_config([str(tmp_path / 'missing.wav')])
+    device, lp = start_engine(config)
+    try:
+        assert lp.lp.frame_get(0, 1) == lp.lp.led_get_color(*PREWARM_FAILED_COLOR)
+        assert lp.lp.frame_get(0, 0) == lp.lp.led_get_color(3, 0)
+        assert (0, 1) in lp.buttons
+
+        # a reload with another missing file is applied as well
+        data = lp.config.to_dict()
+        data['profiles']['bench']['buttons']['1.1'] = {
+            'color': {'red': 0, 'green': 3},
+            'action': [{'sound': {'path': str(tmp_path / 'other.wav')}}],
+        }
+        lp.reload(compile_config(data))
+        assert lp.lp.frame_get(1, 1) == lp.lp.led_get_color(*PREWARM_FAILED_COLOR)
+        assert (1, 1) in lp.buttons
+    finally:
+        lp.stop()